@@ -0,0 +1,171 @@
+"""Stateless JSON API for wish generation, sharing the generation core with the Streamlit UI.
+
+Usage:
+    python api.py --port 8600
+    curl -s localhost:8600/v1/wish -d '{"sender": "Raj", "recipient": "Priya", "relationship": "Friend",
+        "traits": ["Kind"], "life_thing": "music", "language": "English"}'
+
+No session state is kept between requests, so any number of these processes
+can sit behind one nginx upstream.
+"""
+import argparse, hmac, json, os, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import metrics
+from wish_engine import generate_wish, RELATIONSHIPS, TRAITS, LANGUAGES
+from wish_logging import debug_log, log_event, log_context, new_request_id
+
+API_HOST = os.getenv("WISH_API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("WISH_API_PORT", "8600"))
+API_KEYS = [k.strip() for k in os.getenv("WISH_API_KEYS", "").split(",") if k.strip()]  # empty = no auth
+MAX_BODY = 16 * 1024
+MAX_NAME = 60
+
+API_REQUESTS = metrics.counter("wish_api_requests_total", "JSON API requests by route and status", ["route", "status"])
+API_LATENCY = metrics.histogram("wish_api_request_seconds", "JSON API request latency", ["route"])
+
+
+class BadRequest(Exception):
+    """Invalid request payload, reported to the caller as HTTP 400"""
+
+
+def _text(payload, field, required=True, max_len=MAX_NAME):
+    value = payload.get(field, "")
+    if not isinstance(value, str):
+        raise BadRequest(f"{field} must be a string")
+    value = value.strip()
+    if required and not value:
+        raise BadRequest(f"{field} is required")
+    if len(value) > max_len:
+        raise BadRequest(f"{field} must be at most {max_len} characters")
+    return value
+
+
+def parse_wish_request(payload):
+    """Validate a /v1/wish body against the same option sets as the form"""
+    if not isinstance(payload, dict):
+        raise BadRequest("body must be a JSON object")
+    relationship = payload.get("relationship", RELATIONSHIPS[0])
+    if relationship not in RELATIONSHIPS:
+        raise BadRequest(f"relationship must be one of {RELATIONSHIPS}")
+    traits = payload.get("traits")
+    if not isinstance(traits, list) or not 1 <= len(traits) <= 3 or any(t not in TRAITS for t in traits):
+        raise BadRequest(f"traits must be a list of 1-3 of {TRAITS}")
+    language = payload.get("language", LANGUAGES[0])
+    if language not in LANGUAGES:
+        raise BadRequest(f"language must be one of {LANGUAGES}")
+    return {
+        "sender_name": _text(payload, "sender"),
+        "recipient_name": _text(payload, "recipient"),
+        "relationship": relationship,
+        "traits": list(dict.fromkeys(traits)),
+        "life_thing": _text(payload, "life_thing", max_len=100),
+        "language": language,
+    }
+
+
+class WishAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive to nginx
+    server_version = "WishAPI/1.0"
+    disable_nagle_algorithm = True  # Headers and body go out as separate writes
+
+    def log_message(self, format, *args):
+        pass  # Every request is logged as a structured record instead
+
+    def _reply(self, status, payload, request_id=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        if request_id:
+            self.send_header("X-Request-ID", request_id)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        if not API_KEYS:
+            return True
+        auth = self.headers.get("Authorization", "")
+        key = auth[7:] if auth.startswith("Bearer ") else self.headers.get("X-API-Key", "")
+        return any(hmac.compare_digest(key, k) for k in API_KEYS)
+
+    def do_GET(self):
+        route = self.path.split("?")[0]
+        if route == "/healthz":
+            self._reply(200, {"status": "ok"})
+        elif route == "/v1/options":
+            self._reply(200, {"relationships": RELATIONSHIPS, "traits": TRAITS, "languages": LANGUAGES})
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        route = self.path.split("?")[0]
+        if route != "/v1/wish":
+            self._reply(404, {"error": "not found"})
+            return
+        started = time.time()
+        request_id = (self.headers.get("X-Request-ID") or new_request_id())[:64]
+        status, payload = self._wish(request_id)
+        self._reply(status, payload, request_id)
+        elapsed = time.time() - started
+        API_REQUESTS.inc(route=route, status=str(status))
+        API_LATENCY.observe(elapsed, route=route)
+        log_event("api_request", route=route, status=status, request_id=request_id,
+                  latency_ms=round(elapsed * 1000), client=self.headers.get("X-Real-IP", self.client_address[0]))
+
+    def _wish(self, request_id):
+        # The body is never read on these errors, so the connection can't be reused after them
+        header = self.headers.get("Content-Length")
+        if header is None:
+            self.close_connection = True
+            return 411, {"error": "Content-Length required"}
+        try:
+            length = int(header)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            return 400, {"error": "invalid Content-Length"}
+        if length > MAX_BODY:
+            self.close_connection = True
+            return 413, {"error": f"body larger than {MAX_BODY} bytes"}
+        body = self.rfile.read(length)
+        if not self._authorized():
+            return 401, {"error": "invalid or missing API key"}
+        try:
+            params = parse_wish_request(json.loads(body or b"null"))
+        except ValueError as e:  # JSONDecodeError, or UnicodeDecodeError for a body that isn't UTF-8
+            return 400, {"error": f"invalid JSON: {e}"}
+        except BadRequest as e:
+            return 400, {"error": str(e)}
+        try:
+            with log_context(request_id=request_id):
+                wish = generate_wish(**params)
+        except Exception as e:
+            debug_log(f"API generation failed: {type(e).__name__} - {e}")
+            return 500, {"error": "generation failed", "request_id": request_id}
+        return 200, {"wish": wish, "request_id": request_id}
+
+
+class WishAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Absorb connection bursts; the scheduler bounds model load
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stateless JSON API for Diwali wishes")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+
+    metrics.start_metrics_server()
+    server = WishAPIServer((args.host, args.port), WishAPIHandler)
+    print(f"🪔 Wish API on http://{args.host}:{args.port}/v1/wish" + (" (API keys required)" if API_KEYS else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import os, json, hashlib
+from functools import lru_cache
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+# Where browsers fetch static/ from: Streamlit's static serving (app/static) by
+# default, or an nginx/CDN location that adds long-lived cache headers
+STATIC_URL = os.getenv("WISH_STATIC_URL", "app/static").rstrip("/")
+
+
+@lru_cache(maxsize=None)
+def asset_url(name):
+    """Versioned URL for a file in static/; the content hash busts browser caches on deploy"""
+    with open(os.path.join(STATIC_DIR, name), "rb") as f:
+        version = hashlib.sha1(f.read()).hexdigest()[:10]
+    return f"{STATIC_URL}/{name}?v={version}"
+
+
+@lru_cache(maxsize=None)
+def loader_html():
+    """Zero-height component that adds the stylesheet and page script to the top-level page.
+
+    Elements added to the parent document outside Streamlit's tree survive
+    reruns, so the app only has to emit this once per session. If a server
+    sends the files with the wrong MIME type (older Streamlit static serving),
+    they are fetched and inlined instead.
+    """
+    return f"""
+    <script>
+    (function () {{
+        var doc = window.parent.document;
+        function inline(tag, url, id) {{
+            fetch(url).then(function (r) {{ return r.text(); }}).then(function (text) {{
+                var el = doc.createElement(tag);
+                el.id = id + '-inline';
+                el.textContent = text;
+                doc.head.appendChild(el);
+            }});
+        }}
+        function load(tag, url, id) {{
+            if (doc.getElementById(id) || doc.getElementById(id + '-inline')) {{
+                return;
+            }}
+            var el = doc.createElement(tag);
+            el.id = id;
+            if (tag === 'link') {{
+                el.rel = 'stylesheet';
+                el.href = url;
+            }} else {{
+                el.src = url;
+            }}
+            el.onerror = function () {{
+                el.remove();
+                inline(tag === 'link' ? 'style' : 'script', url, id);
+            }};
+            doc.head.appendChild(el);
+        }}
+        var viewport = doc.querySelector('meta[name="viewport"]');
+        if (viewport) {{
+            viewport.content = 'width=device-width, initial-scale=1, maximum-scale=5, user-scalable=yes';
+        }}
+        load('link', new URL({json.dumps(asset_url("wish.css"))}, doc.baseURI).href, 'wish-css');
+        load('script', new URL({json.dumps(asset_url("wish.js"))}, doc.baseURI).href, 'wish-js');
+    }})();
+    </script>
+    """
@@ -0,0 +1,126 @@
+import asyncio, queue, threading, contextvars
+from concurrent.futures import CancelledError
+from contextlib import contextmanager
+
+_DONE = object()
+_local = threading.local()
+
+
+class CancelScope:
+    """Lets another thread stop the model calls a thread makes through the engine.
+
+    Raising from on_token only works once tokens arrive; a scope also stops
+    non-streaming calls. Cancelled calls raise error() in the calling thread.
+    """
+
+    def __init__(self, error=CancelledError):
+        self.error = error
+        self.cancelled = False
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def attach(self, future):
+        with self._lock:
+            if not self.cancelled:
+                self._futures.add(future)
+                future.add_done_callback(self._futures.discard)
+                return
+        future.cancel()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+
+
+@contextmanager
+def cancel_scope(scope):
+    """Attach every engine call made by this thread inside the block to scope"""
+    _local.scope = scope
+    try:
+        yield scope
+    finally:
+        _local.scope = None
+
+
+async def _with_context(ctx, coro):
+    # Carry the caller's context vars (log request/session ids) onto the engine loop
+    for var, value in ctx.items():
+        var.set(value)
+    return await coro
+
+
+class AsyncEngine:
+    """A dedicated asyncio event loop that Streamlit sessions submit generations to.
+
+    Model I/O runs as coroutines on one background thread, so many slow
+    generations overlap without holding an OS thread each while they wait
+    on the network.
+    """
+
+    def __init__(self, name="wish-async-engine"):
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self.loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._run_loop, name=self.name, daemon=True)
+                self._thread.start()
+        return self
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the engine loop; returns a concurrent.futures.Future"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(_with_context(contextvars.copy_context(), coro), self.loop)
+
+    def run(self, coro_fn, *args, on_token=None):
+        """Run coro_fn(*args) on the engine loop and block the calling thread for the result.
+
+        on_token callbacks are delivered on the calling thread (Streamlit
+        elements can only be updated from their script thread). Partial texts
+        that pile up are skipped in favour of the newest one.
+        """
+        scope = getattr(_local, "scope", None)
+        tokens = queue.SimpleQueue()
+        if on_token is None:
+            future = self.submit(coro_fn(*args))
+        else:
+            future = self.submit(coro_fn(*args, on_token=tokens.put))
+            future.add_done_callback(lambda _: tokens.put(_DONE))
+        if scope is not None:
+            scope.attach(future)
+        try:
+            while on_token is not None:
+                item = tokens.get()
+                while item is not _DONE and not tokens.empty():
+                    item = tokens.get()
+                if item is _DONE:
+                    break
+                on_token(item)
+            return future.result()
+        except CancelledError:
+            if scope is not None and scope.cancelled:
+                raise scope.error() from None
+            raise
+        except BaseException:
+            # A Streamlit rerun interrupted the wait; stop the generation too
+            future.cancel()
+            raise
+
+
+_engine = AsyncEngine()
+
+
+def get_engine():
+    """The shared engine, started on first use"""
+    return _engine.start()
@@ -0,0 +1,415 @@
+import os, json, time, random, asyncio, threading
+from collections import deque
+from http_pool import post, get_openai_client, CONNECT_ERRORS
+from async_engine import get_engine
+import metrics
+from wish_logging import debug_log
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from scheduler import generation_scheduler
+
+# Configuration - Load from environment variables
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_HOSTS = [h.strip().rstrip("/") for h in os.getenv("OLLAMA_HOSTS", OLLAMA_HOST).split(",") if h.strip()]
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
+OLLAMA_STREAM = os.getenv("OLLAMA_STREAM", "1") != "0"
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+WISH_BACKENDS = os.getenv("WISH_BACKENDS", "ollama,openai")
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.3"))
+HEDGE_ENABLED = os.getenv("WISH_HEDGE", "0") == "1"
+HEDGE_BACKEND = os.getenv("WISH_HEDGE_BACKEND", "")  # defaults to the second tier
+HEDGE_BUDGET = os.getenv("WISH_HEDGE_BUDGET", "p95")  # seconds, or a percentile of recent primary latency
+HEDGE_MIN_BUDGET = float(os.getenv("WISH_HEDGE_MIN_BUDGET", "2"))
+HEDGE_DEFAULT_BUDGET = float(os.getenv("WISH_HEDGE_DEFAULT_BUDGET", "10"))
+
+TTFT = metrics.histogram("wish_ttft_seconds", "Time to first streamed token", ["backend"])
+TOKENS = metrics.counter("wish_tokens_total", "Model tokens processed", ["backend", "kind"])
+
+
+def record_tokens(backend, prompt_tokens, completion_tokens):
+    if prompt_tokens:
+        TOKENS.inc(prompt_tokens, backend=backend, kind="prompt")
+    if completion_tokens:
+        TOKENS.inc(completion_tokens, backend=backend, kind="completion")
+
+
+class BackendUnavailable(Exception):
+    """Raised when a backend can't take the request right now"""
+
+
+class Backend:
+    """A model that can turn a prompt into wish text"""
+
+    name = "backend"
+    # Local models take a generation scheduler slot; hosted APIs don't
+    scheduled = False
+
+    async def agenerate(self, prompt, on_token=None):
+        """Return the generated text, calling on_token(text_so_far) if streaming.
+
+        Runs on the async engine loop; on_token is called from that loop.
+        """
+        raise NotImplementedError
+
+    def generate(self, prompt, on_token=None):
+        """Blocking wrapper running agenerate on the shared async engine"""
+        return get_engine().run(self.agenerate, prompt, on_token=on_token)
+
+    def stats(self):
+        return {}
+
+
+class OllamaBackend(Backend):
+    """One Ollama host"""
+
+    scheduled = True
+
+    def __init__(self, host, model, stream=True):
+        self.host = host
+        self.model = model
+        self.stream = stream
+        self.name = f"ollama@{host}"
+
+    async def agenerate(self, prompt, on_token=None):
+        stream = on_token is not None and self.stream
+        started = time.time()
+        response = await post(f"{self.host}/api/generate",
+                              json={"model": self.model, "prompt": prompt, "stream": stream})
+        try:
+            debug_log(f"Ollama response status: {response.status_code}")
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", errors="replace")
+                raise RuntimeError(f"Status code: {response.status_code}, Response: {body[:200]}")
+            if not stream:
+                data = json.loads(await response.aread())
+                record_tokens("ollama", data.get("prompt_eval_count"), data.get("eval_count"))
+                return data["response"].strip()
+
+            first_token_at = None
+            text = ""
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(f"Stream error: {data['error']}")
+                token = data.get("response", "")
+                if token:
+                    if first_token_at is None:
+                        first_token_at = time.time()
+                        TTFT.observe(first_token_at - started, backend="ollama")
+                        debug_log(f"Ollama first token after {first_token_at - started:.2f}s")
+                    text += token
+                    on_token(text)
+                if data.get("done"):
+                    record_tokens("ollama", data.get("prompt_eval_count"), data.get("eval_count"))
+                    break
+            return text.strip()
+        finally:
+            await response.aclose()
+
+
+class _HostState:
+    def __init__(self, backend):
+        self.backend = backend
+        self.breaker = CircuitBreaker(backend.name)
+        self.ewma = None  # seconds; None until the first success
+        self.in_flight = 0
+
+
+class OllamaRouter(Backend):
+    """Routes each request to the Ollama host with the lowest recent latency and queue.
+
+    Hosts are scored by EWMA latency x (in-flight + 1); untried hosts score
+    zero so they get explored. Each host has its own circuit breaker, so a
+    node that keeps failing or timing out is skipped until a probe succeeds
+    instead of adding a timeout to every wish.
+    """
+
+    name = "ollama"
+    scheduled = True
+
+    def __init__(self, backends, alpha=0.3):
+        self.alpha = alpha
+        self._hosts = [_HostState(b) for b in backends]
+        self._lock = threading.Lock()
+
+    def _pick(self, exclude=()):
+        with self._lock:
+            ranked = sorted((h for h in self._hosts if h not in exclude),
+                            key=lambda h: ((h.ewma or 0.0) * (h.in_flight + 1), random.random()))
+        for host in ranked:
+            if host.breaker.allow():
+                with self._lock:
+                    host.in_flight += 1
+                return host
+        raise CircuitOpenError("every Ollama host's circuit is open")
+
+    async def agenerate(self, prompt, on_token=None, tried=None):
+        """tried: hosts to skip; a hedge passes the list its primary picks into, so the two never share a host"""
+        # Connection failures are fast, so try the next healthy host straight away
+        last_error = None
+        tried = [] if tried is None else tried
+        for _ in self._hosts:
+            try:
+                host = self._pick(exclude=tried)
+            except CircuitOpenError:
+                if last_error is None:
+                    raise
+                break
+            tried.append(host)
+            try:
+                return await self._agenerate_on(host, prompt, on_token)
+            except CONNECT_ERRORS as e:
+                last_error = e
+        raise last_error
+
+    async def _agenerate_on(self, host, prompt, on_token):
+        started = time.time()
+        try:
+            text = await host.backend.agenerate(prompt, on_token=on_token)
+        except Exception:
+            host.breaker.record_failure()
+            raise
+        except BaseException:
+            host.breaker.release()
+            # Cancelled (usually by a hedge): it took at least this long, so a slow host can't keep scoring 0
+            elapsed = time.time() - started
+            if host.ewma is None or elapsed > host.ewma:
+                self._observe(host, elapsed)
+            raise
+        finally:
+            with self._lock:
+                host.in_flight -= 1
+        host.breaker.record_success()
+        self._observe(host, time.time() - started)
+        return text
+
+    def _observe(self, host, elapsed):
+        with self._lock:
+            host.ewma = elapsed if host.ewma is None else self.alpha * elapsed + (1 - self.alpha) * host.ewma
+
+    def stats(self):
+        with self._lock:
+            return {h.backend.host: {
+                "ewma_latency": round(h.ewma, 3) if h.ewma is not None else None,
+                "in_flight": h.in_flight,
+                **h.breaker.stats(),
+            } for h in self._hosts}
+
+
+class OpenAIBackend(Backend):
+    """OpenAI chat completions"""
+
+    name = "openai"
+
+    def __init__(self, model):
+        self.model = model
+        self.breaker = CircuitBreaker(self.name)
+
+    async def agenerate(self, prompt, on_token=None):
+        return await self.breaker.acall(self._complete, prompt)
+
+    async def _complete(self, prompt):
+        response = await get_openai_client().chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=200
+        )
+        if response.usage:
+            record_tokens("openai", response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response.choices[0].message.content.strip()
+
+    def stats(self):
+        return self.breaker.stats()
+
+
+class HedgedBackend(Backend):
+    """Races a secondary backend against a slow primary.
+
+    The primary starts alone. If it hasn't answered within the latency
+    budget (a fixed number of seconds, or a percentile like "p95" of recent
+    primary latencies), the secondary is fired in parallel. Whichever
+    finishes first wins and the other is cancelled. A primary that fails
+    outright falls through to the secondary immediately.
+
+    The primary runs under the request's scheduler slot; a hedge on a
+    scheduled backend needs a second slot and is skipped when none is free.
+    Hedging on the primary's own router sends the hedge to a different host.
+    """
+
+    def __init__(self, primary, secondary, budget="p95", min_budget=2.0, default_budget=10.0, min_samples=20):
+        self.primary = primary
+        self.secondary = secondary
+        self.name = f"{primary.name}+hedge:{secondary.name}"
+        self.scheduled = primary.scheduled
+        self.budget = budget
+        self.min_budget = min_budget
+        self.default_budget = default_budget
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedged = 0
+        self.secondary_wins = 0
+        self.fallbacks = 0
+        self.skipped = 0
+        self._latencies = deque(maxlen=200)
+
+    def current_budget(self):
+        """Seconds to wait on the primary before hedging"""
+        budget = str(self.budget).strip().lower()
+        if not budget.startswith("p"):
+            return float(budget)
+        if len(self._latencies) < self.min_samples:
+            return self.default_budget
+        samples = sorted(self._latencies)
+        index = min(len(samples) - 1, int(float(budget[1:]) / 100 * len(samples)))
+        return max(self.min_budget, samples[index])
+
+    async def agenerate(self, prompt, on_token=None):
+        self.requests += 1
+        started = time.time()
+        # Same router on both sides: share the picked-hosts list so the hedge avoids the primary's host
+        routed = {"tried": []} if self.secondary is self.primary else {}
+        primary = asyncio.ensure_future(self.primary.agenerate(prompt, on_token=on_token, **routed))
+        secondary = None
+        slot = None
+        try:
+            budget = self.current_budget()
+            done, _ = await asyncio.wait({primary}, timeout=budget)
+            if done and primary.exception() is None:
+                self._latencies.append(time.time() - started)
+                return primary.result()
+            # A scheduled secondary needs a slot of its own unless it replaces a failed scheduled primary
+            if self.secondary.scheduled and not (done and self.primary.scheduled):
+                acquired, token = generation_scheduler.try_acquire()
+                if not acquired:
+                    self.skipped += 1
+                    if done:
+                        raise primary.exception()
+                    debug_log(f"⏱️ {self.primary.name} over {budget:.1f}s budget, no free slot to hedge")
+                    text = await primary
+                    self._latencies.append(time.time() - started)
+                    return text
+                slot = (token,)
+            if done:
+                self.fallbacks += 1
+            else:
+                self.hedged += 1
+                debug_log(f"⏱️ {self.primary.name} over {budget:.1f}s budget, hedging with {self.secondary.name}")
+            secondary = asyncio.ensure_future(self.secondary.agenerate(prompt, **routed))
+            pending = {secondary} if done else {primary, secondary}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        continue
+                    if task is secondary:
+                        if primary in pending:
+                            self.secondary_wins += 1
+                            # The primary took at least this long; keep it in the budget window
+                            self._latencies.append(time.time() - started)
+                    else:
+                        self._latencies.append(time.time() - started)
+                    return task.result()
+            raise (primary.exception() or secondary.exception())
+        finally:
+            for task in (primary, secondary):
+                if task is not None and not task.done():
+                    task.cancel()
+            if slot is not None:
+                generation_scheduler.release(slot[0])
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "secondary_wins": self.secondary_wins,
+            "fallbacks": self.fallbacks,
+            "skipped_no_slot": self.skipped,
+            "hedge_rate": round(self.hedged / self.requests, 4) if self.requests else 0.0,
+            "win_rate": round(self.secondary_wins / self.hedged, 4) if self.hedged else 0.0,
+            "budget": round(self.current_budget(), 3),
+        }
+
+
+# Registry of backend factories; each returns a Backend or None when not configured
+BACKEND_FACTORIES = {}
+
+
+def register_backend(name):
+    """Decorator registering a factory under a name usable in WISH_BACKENDS"""
+    def decorator(factory):
+        BACKEND_FACTORIES[name] = factory
+        return factory
+    return decorator
+
+
+@register_backend("ollama")
+def _ollama_from_env():
+    return OllamaRouter([OllamaBackend(host, OLLAMA_MODEL, OLLAMA_STREAM) for host in OLLAMA_HOSTS],
+                        alpha=ROUTER_EWMA_ALPHA)
+
+
+@register_backend("openai")
+def _openai_from_env():
+    return OpenAIBackend(OPENAI_MODEL) if OPENAI_API_KEY else None
+
+
+def load_backends(names=None):
+    """Build the backends named in WISH_BACKENDS, as an ordered {name: backend} dict"""
+    backends = {}
+    for name in (names or WISH_BACKENDS).split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in BACKEND_FACTORIES:
+            raise ValueError(f"Unknown backend '{name}' in WISH_BACKENDS (known: {', '.join(BACKEND_FACTORIES)})")
+        backend = BACKEND_FACTORIES[name]()
+        if backend is not None:
+            backends[name] = backend
+    return backends
+
+
+def build_tiers(backends):
+    """Order backends into fallback tiers, wrapping the first in a hedge if enabled"""
+    tiers = list(backends.values())
+    if not HEDGE_ENABLED or not tiers:
+        return tiers
+    secondary = backends.get(HEDGE_BACKEND) if HEDGE_BACKEND else (tiers[1] if len(tiers) > 1 else None)
+    if secondary is None:
+        debug_log(f"⚠️ WISH_HEDGE is on but no secondary backend is configured; hedging disabled")
+        return tiers
+    if secondary is tiers[0] and not (isinstance(secondary, OllamaRouter) and len(secondary._hosts) > 1):
+        debug_log(f"⚠️ Hedging {HEDGE_BACKEND} against itself needs a second Ollama host; hedging disabled")
+        return tiers
+    hedged = HedgedBackend(tiers[0], secondary, budget=HEDGE_BUDGET,
+                           min_budget=HEDGE_MIN_BUDGET, default_budget=HEDGE_DEFAULT_BUDGET)
+    return [hedged] + [t for t in tiers[1:] if t is not secondary]
+
+
+_backends = None
+_tiers = None
+_tiers_lock = threading.Lock()
+
+
+def get_backends():
+    """Backend tiers, built on first use"""
+    global _backends, _tiers
+    if _tiers is None:
+        with _tiers_lock:
+            if _tiers is None:
+                _backends = load_backends()
+                _tiers = build_tiers(_backends)
+    return _tiers
+
+
+def get_backend(name):
+    """The configured backend with the given WISH_BACKENDS name, or None"""
+    get_backends()
+    return _backends.get(name)
+
+
+def all_backends():
+    """Every configured backend (unwrapped), in WISH_BACKENDS order"""
+    get_backends()
+    return list(_backends.values())
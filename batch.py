@@ -0,0 +1,198 @@
+"""Bulk wishes: CSV of recipients in, CSV or JSONL of wishes out.
+
+Usage:
+    python batch.py employees.csv --output wishes.csv --workers 4
+    python batch.py employees.csv --output wishes.jsonl
+
+Input columns: sender, recipient, relationship, traits, life_thing, language
+(traits separated by ';' or '|'; an optional id column is carried through).
+Results are appended as each wish completes, so an interrupted run resumes
+by re-running the same command: rows already in the output are skipped.
+Rows that only got the static template because the model was busy or down
+are written with status "shed" or "fallback"; a resumed run removes them
+(and failed rows) from the output and generates them again.
+"""
+import argparse, csv, io, itertools, json, os, re, sys, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from api import parse_wish_request, BadRequest
+from wish_engine import generate_wish
+
+BATCH_WORKERS = int(os.getenv("WISH_BATCH_WORKERS", "4"))
+BATCH_MAX_ROWS = int(os.getenv("WISH_BATCH_MAX_ROWS", "1000"))  # UI upload limit
+OUTPUT_FIELDS = ["row", "id", "sender", "recipient", "language", "status", "wish", "error"]
+# Rows that only got the static template; resuming generates them again
+DEFERRED = {"shed": "model busy, retry later", "fallback": "no model reachable, retry later"}
+
+
+def parse_rows(lines):
+    """Read CSV lines into request payloads (validation happens per row later)"""
+    rows = []
+    for number, record in enumerate(csv.DictReader(lines), start=1):
+        record = {(k or "").strip().lower(): (v or "").strip() for k, v in record.items()}
+        traits = [t.strip().title() for t in re.split(r"[;|]", record.get("traits", "")) if t.strip()]
+        rows.append({
+            "row": number,
+            "id": record.get("id", ""),
+            "sender": record.get("sender", ""),
+            "recipient": record.get("recipient", ""),
+            "relationship": record.get("relationship", "").title() or "Friend",
+            "traits": traits,
+            "life_thing": record.get("life_thing", ""),
+            "language": record.get("language", "").title() or "English",
+        })
+    return rows
+
+
+def output_record(row, status="ok", wish="", error=""):
+    return {"row": row["row"], "id": row["id"], "sender": row["sender"], "recipient": row["recipient"],
+            "language": row["language"], "status": status, "wish": wish, "error": error}
+
+
+def generate_row(row):
+    """One result record for one input row; never raises"""
+    result = output_record(row)
+    sources = []
+    try:
+        result["wish"] = generate_wish(**parse_wish_request(row), on_served=sources.append)
+        if sources and sources[0] in DEFERRED:
+            # Keep the static template out of the output; it isn't a wish for this person
+            result.update(status=sources[0], wish="", error=DEFERRED[sources[0]])
+    except BadRequest as e:
+        result.update(status="invalid", error=str(e))
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    return result
+
+
+def run_batch(rows, workers=BATCH_WORKERS, done=()):
+    """Yield result records as they complete, at most `workers` wishes in flight.
+
+    Rows whose number is in `done` are skipped. Generation goes through the
+    same cache, skeleton pool and scheduler as the UI, so repeated
+    relationship/traits/language combos are cheap and the local model is
+    never oversubscribed.
+    """
+    done = set(done)
+    pending = iter([row for row in rows if row["row"] not in done])
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="wish-batch")
+    try:
+        # Keep a bounded window of submitted rows instead of queueing the whole file
+        futures = {executor.submit(generate_row, row) for row in itertools.islice(pending, max(1, workers) * 2)}
+        while futures:
+            future = next(as_completed(futures))
+            futures.remove(future)
+            row = next(pending, None)
+            if row is not None:
+                futures.add(executor.submit(generate_row, row))
+            yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def results_to_csv(results):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=OUTPUT_FIELDS)
+    writer.writeheader()
+    writer.writerows(sorted(results, key=lambda r: r["row"]))
+    return buffer.getvalue()
+
+
+def repair_tail(path, fmt):
+    """Cut a partial last record left by a killed run, so appended rows start on a fresh line"""
+    if not os.path.exists(path):
+        return
+    # CSV records end in \r\n; newlines inside a quoted wish are bare \n
+    terminator = b"\n" if fmt == "jsonl" else b"\r\n"
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(terminator):
+            end = data.rfind(terminator)
+            f.truncate(end + len(terminator) if end >= 0 else 0)
+            print(f"✂️  Dropped a partial record at the end of {path}")
+
+
+def resume_output(path, fmt):
+    """Row numbers already done in an earlier run's output.
+
+    Records that will be generated again (deferred, errors) are dropped from
+    the file first, so a resumed run doesn't leave two records for one row.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "jsonl":
+            lines = f.readlines()
+            records = []
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    records.append(None)  # A partial line from a killed run
+        else:
+            records = list(csv.DictReader(f))
+    done, keep = set(), []
+    for index, record in enumerate(records):
+        if isinstance(record, dict) and record.get("status") in ("ok", "invalid"):
+            try:
+                done.add(int(record["row"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+            keep.append(lines[index] if fmt == "jsonl" else record)
+    if len(keep) < len(records):
+        partial = f"{path}.tmp"
+        with open(partial, "w", encoding="utf-8", newline="") as f:
+            if fmt == "jsonl":
+                f.writelines(keep)
+            else:
+                writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS, extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(keep)
+        os.replace(partial, path)
+        print(f"🧹 Removed {len(records) - len(keep)} records from {path} to generate again")
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Diwali wishes for every row of a CSV")
+    parser.add_argument("input", help="CSV with sender, recipient, relationship, traits, life_thing, language")
+    parser.add_argument("--output", default="wishes.csv", help=".csv or .jsonl; appended to when resuming")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="default: from --output")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="wishes generated concurrently")
+    args = parser.parse_args()
+    fmt = args.format or ("jsonl" if args.output.endswith(".jsonl") else "csv")
+
+    with open(args.input, encoding="utf-8-sig", newline="") as f:
+        rows = parse_rows(f)
+    repair_tail(args.output, fmt)
+    done = resume_output(args.output, fmt)
+    todo = len([r for r in rows if r["row"] not in done])
+    print(f"📋 {len(rows)} rows in {args.input}; {len(done)} already done, {todo} to generate")
+
+    started = time.time()
+    counts = {"ok": 0, "invalid": 0, "error": 0, **dict.fromkeys(DEFERRED, 0)}
+    new_file = not os.path.exists(args.output) or os.path.getsize(args.output) == 0
+    with open(args.output, "a", encoding="utf-8", newline="") as out:
+        writer = csv.DictWriter(out, fieldnames=OUTPUT_FIELDS) if fmt == "csv" else None
+        if writer and new_file:
+            writer.writeheader()
+        try:
+            for result in run_batch(rows, args.workers, done):
+                if writer:
+                    writer.writerow(result)
+                else:
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                counts[result["status"]] += 1
+                if result["status"] != "ok":
+                    print(f"  ✗ row {result['row']}: {result['error']}", file=sys.stderr)
+                finished = sum(counts.values())
+                if finished % 25 == 0:
+                    print(f"  ✓ {finished}/{todo} ({finished / (time.time() - started):.1f}/s)")
+        except KeyboardInterrupt:
+            print("\n⏸️  Interrupted; re-run the same command to resume")
+
+    print(f"✅ {counts} in {time.time() - started:.0f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
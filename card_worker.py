@@ -0,0 +1,8 @@
+"""Entry module for the card render processes.
+
+Spawned children re-run the parent's __main__; under Streamlit that is
+app.py, which would load the whole engine, its reaper and log threads into
+every render process. cards.py starts the children from this module instead,
+so they only import cards and Pillow.
+"""
+import cards  # noqa: F401
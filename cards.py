@@ -0,0 +1,317 @@
+import os, io, re, sys, time, hashlib, importlib, threading
+from multiprocessing import util as mp_util
+from multiprocessing.context import SpawnContext, SpawnProcess
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+import metrics
+from wish_logging import debug_log
+
+# Shareable image cards
+CARD_WORKERS = int(os.getenv("WISH_CARD_WORKERS", "2"))           # render processes, 0 = render in-thread
+CARD_CACHE_SIZE = int(os.getenv("WISH_CARD_CACHE_SIZE", "128"))   # rendered cards kept in memory
+CARD_TIMEOUT = float(os.getenv("WISH_CARD_TIMEOUT", "10"))
+CARD_SIZE = (1080, 1350)  # 4:5 portrait, shown uncropped by WhatsApp and Instagram
+CARD_VERSION = "1"        # bump when the artwork changes so cached cards are re-rendered
+TEXT_TOP = 290            # the wish is centred between here and the diyas
+
+DEVANAGARI = re.compile(r"[\u0900-\u097F]")
+# Colour emoji need bitmap fonts Pillow can't mix into text; the artwork carries the festive bits
+EMOJI = re.compile(r"[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B50\u2B55\uFE0F\u200D]")
+
+FONT_DIRS = ["/usr/share/fonts/truetype", "/usr/share/fonts/opentype", "/usr/share/fonts",
+             "/Library/Fonts", "/System/Library/Fonts/Supplemental", os.path.expanduser("~/.fonts")]
+LATIN_FONTS = [os.getenv("WISH_CARD_FONT", ""), "NotoSans-Regular.ttf", "DejaVuSans.ttf", "FreeSans.ttf",
+               "Arial.ttf"]
+LATIN_BOLD_FONTS = [os.getenv("WISH_CARD_FONT_BOLD", ""), "NotoSerif-Bold.ttf", "DejaVuSerif-Bold.ttf",
+                    "FreeSerifBold.ttf", "Georgia Bold.ttf"]
+# Hindi cards need one of these (fonts-noto-core, fonts-lohit-deva or fonts-freefont-ttf)
+DEVANAGARI_FONTS = [os.getenv("WISH_CARD_FONT_DEVANAGARI", ""), "NotoSansDevanagari-Regular.ttf",
+                    "Lohit-Devanagari.ttf", "FreeSans.ttf", "Devanagari Sangam MN.ttc"]
+
+TEMPLATES = {
+    # name: (top colour, bottom colour, accent, text colour)
+    "diya": ((92, 15, 40), (214, 92, 22), (255, 200, 87), (255, 248, 231)),
+    "rangoli": ((58, 12, 100), (196, 38, 120), (255, 214, 102), (255, 246, 250)),
+    "marigold": ((120, 35, 0), (236, 140, 20), (255, 236, 160), (255, 252, 240)),
+}
+
+
+@lru_cache(maxsize=None)
+def find_font(candidates):
+    """First candidate file found in the usual font directories, or None"""
+    for name in candidates:
+        if not name:
+            continue
+        if os.path.isabs(name) and os.path.exists(name):
+            return name
+        for root in FONT_DIRS:
+            for dirpath, _, files in os.walk(root):
+                if name in files:
+                    return os.path.join(dirpath, name)
+    return None
+
+
+def supports(text):
+    """Whether this box has fonts for the wish (Hindi needs a Devanagari font)"""
+    return not DEVANAGARI.search(text or "") or find_font(tuple(DEVANAGARI_FONTS)) is not None
+
+
+def pick_template(text):
+    """Stable per wish, so the same wish always gets the same card"""
+    names = sorted(TEMPLATES)
+    return names[int(hashlib.sha1(text.encode("utf-8")).hexdigest(), 16) % len(names)]
+
+
+def card_key(text, template):
+    return hashlib.sha256(f"{CARD_VERSION}|{template}|{text}".encode("utf-8")).hexdigest()
+
+
+# Everything below runs inside the render processes; fonts, artwork and
+# layouts are built once per process and reused for every card
+
+
+@lru_cache(maxsize=64)
+def _font(devanagari, bold, size):
+    from PIL import ImageFont
+    candidates = DEVANAGARI_FONTS if devanagari else (LATIN_BOLD_FONTS if bold else LATIN_FONTS)
+    path = find_font(tuple(candidates))
+    if path is None:
+        return ImageFont.load_default(size)
+    # Raqm shapes Devanagari conjuncts and matras; without it they render unjoined
+    from PIL import features
+    engine = ImageFont.Layout.RAQM if features.check("raqm") else ImageFont.Layout.BASIC
+    return ImageFont.truetype(path, size, layout_engine=engine)
+
+
+@lru_cache(maxsize=None)
+def _artwork(template):
+    """Background, border and diyas for a template, drawn once per process"""
+    from PIL import Image, ImageDraw, ImageOps
+    top, bottom, accent, _ = TEMPLATES[template]
+    width, height = CARD_SIZE
+    card = ImageOps.colorize(Image.linear_gradient("L").resize(CARD_SIZE), top, bottom).convert("RGB")
+    draw = ImageDraw.Draw(card)
+    draw.rounded_rectangle((30, 30, width - 30, height - 30), radius=40, outline=accent, width=6)
+    draw.rounded_rectangle((48, 48, width - 48, height - 48), radius=30, outline=accent, width=2)
+    # Rangoli dots in the corners
+    for cx, cy in ((110, 110), (width - 110, 110), (110, height - 110), (width - 110, height - 110)):
+        for ring, radius in enumerate((34, 22, 10)):
+            colour = accent if ring % 2 == 0 else bottom
+            draw.ellipse((cx - radius, cy - radius, cx + radius, cy + radius), fill=colour)
+    # A row of diyas along the bottom edge
+    for i in range(5):
+        cx = width // 2 + (i - 2) * 150
+        base = height - 150
+        draw.chord((cx - 50, base - 30, cx + 50, base + 40), 0, 180, fill=(150, 60, 20), outline=accent, width=3)
+        draw.ellipse((cx - 12, base - 70, cx + 12, base - 12), fill=(255, 170, 40))
+        draw.ellipse((cx - 6, base - 52, cx + 6, base - 20), fill=(255, 240, 180))
+    return card
+
+
+@lru_cache(maxsize=256)
+def _layout(text, devanagari, box_width, box_height):
+    """Largest font size whose word-wrapped lines fit the text box: (size, lines, line height)"""
+    for size in range(56, 25, -2):
+        font = _font(devanagari, False, size)
+        line_height = int(size * (1.6 if devanagari else 1.4))
+        lines = []
+        for paragraph in text.split("\n"):
+            words, line = paragraph.split(), ""
+            for word in words:
+                candidate = f"{line} {word}".strip()
+                if line and font.getlength(candidate) > box_width:
+                    lines.append(line)
+                    line = word
+                else:
+                    line = candidate
+            lines.append(line)
+        if len(lines) * line_height <= box_height:
+            return size, tuple(lines), line_height
+    return size, tuple(lines[:box_height // line_height]), line_height
+
+
+def _preload():
+    """Process pool initializer: load fonts and draw every template before the first request"""
+    for template in TEMPLATES:
+        _artwork(template)
+    for devanagari in (False, True):
+        _font(devanagari, True, 64)
+        for size in range(56, 25, -2):
+            _font(devanagari, False, size)
+
+
+def _text_layout(text):
+    """Layout of the wish without emoji: (devanagari, size, lines, line height)"""
+    text = re.sub(r"[ \t]+", " ", EMOJI.sub("", text)).strip()
+    devanagari = bool(DEVANAGARI.search(text))
+    width, height = CARD_SIZE
+    return (devanagari,) + _layout(text, devanagari, width - 240, height - 260 - TEXT_TOP)
+
+
+def render_card(text, template, reveal=None):
+    """JPEG bytes of the wish drawn on a template (runs in a render process).
+
+    reveal draws only the first N lines, already in their final places, for video frames.
+    """
+    from PIL import ImageDraw
+    devanagari, size, lines, line_height = _text_layout(text)
+    _, _, accent, ink = TEMPLATES[template]
+    card = _artwork(template).copy()
+    draw = ImageDraw.Draw(card)
+    width, height = CARD_SIZE
+
+    title = "शुभ दीपावली" if devanagari else "Happy Diwali"
+    title_font = _font(devanagari, not devanagari, 64)
+    draw.text((width // 2, 190), title, font=title_font, fill=accent, anchor="mm")
+
+    font = _font(devanagari, False, size)
+    y = TEXT_TOP + (height - 260 - TEXT_TOP - len(lines) * line_height) // 2
+    for line in lines[:reveal]:
+        draw.text((width // 2, y + line_height // 2), line, font=font, fill=ink, anchor="mm")
+        y += line_height
+
+    out = io.BytesIO()
+    card.save(out, format="JPEG", quality=88, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def render_reveal(text, template):
+    """JPEG frames from the bare title card to the full wish, one line at a time"""
+    _, _, lines, _ = _text_layout(text)
+    return [render_card(text, template, reveal=count) for count in range(len(lines) + 1)]
+
+
+_spawn_lock = threading.Lock()
+
+
+class _RenderProcess(SpawnProcess):
+    """Spawned render process that starts from card_worker rather than the parent's __main__"""
+
+    def start(self):
+        with _spawn_lock:
+            main = sys.modules["__main__"]
+            sys.modules["__main__"] = importlib.import_module("card_worker")
+            try:
+                super().start()
+            finally:
+                sys.modules["__main__"] = main
+
+
+class _RenderContext(SpawnContext):
+    # spawn: forking a process full of Streamlit and engine threads isn't safe
+    Process = _RenderProcess
+
+
+class CardRenderer:
+    """Renders cards in a process pool and keeps the results by content hash.
+
+    Repeat renders of the same wish (every rerun of the result view, every
+    download) come from the cache, and identical renders already in flight
+    share one future. Pillow work stays off the Streamlit script threads.
+    """
+
+    def __init__(self, workers=CARD_WORKERS, cache_size=CARD_CACHE_SIZE):
+        self.workers = workers
+        self.cache_size = cache_size
+        self.hits = 0
+        self.renders = 0
+        self.errors = 0
+        self._cache = OrderedDict()  # key -> JPEG bytes
+        self._in_flight = {}         # key -> Future
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pool_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls()
+
+    def _pool(self):
+        with self._pool_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_preload,
+                                                     mp_context=_RenderContext())
+                # Exit hooks join child processes before atexit runs, so shut the pool down from
+                # a multiprocessing finalizer, ahead of the queue finalizers (priority 10) that
+                # would otherwise close the pipe before the workers get their stop sentinel
+                mp_util.Finalize(None, self.shutdown, exitpriority=100)
+            return self._executor
+
+    def shutdown(self):
+        """Stop the render processes, dropping queued cards (runs at exit)"""
+        with self._pool_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, text, template=None):
+        """Future for the card's JPEG bytes; already resolved on a cache hit"""
+        template = template or pick_template(text)
+        key = card_key(text, template)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                CARD_RENDERS.inc(result="hit")
+                future = Future()
+                future.set_result(self._cache[key])
+                return future
+            if key in self._in_flight:
+                self.hits += 1
+                CARD_RENDERS.inc(result="shared")
+                return self._in_flight[key]
+            started = time.time()
+            if self.workers > 0:
+                future = self._pool().submit(render_card, text, template)
+            else:
+                future = Future()
+                try:
+                    future.set_result(render_card(text, template))
+                except Exception as e:
+                    future.set_exception(e)
+            self._in_flight[key] = future
+        future.add_done_callback(lambda f: self._finished(key, f, started))
+        return future
+
+    def _finished(self, key, future, started):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if future.exception() is not None:
+                self.errors += 1
+                CARD_RENDERS.inc(result="error")
+                debug_log(f"Card render failed: {type(future.exception()).__name__} - {future.exception()}")
+                return
+            self.renders += 1
+            self._cache[key] = future.result()
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        CARD_RENDERS.inc(result="rendered")
+        CARD_RENDER_SECONDS.observe(time.time() - started)
+
+    def render(self, text, template=None, timeout=CARD_TIMEOUT):
+        """JPEG bytes, or None if rendering failed or took too long"""
+        try:
+            return self.submit(text, template).result(timeout)
+        except Exception as e:
+            debug_log(f"Card unavailable: {type(e).__name__} - {e}")
+            return None
+
+    def frames(self, text, template=None, timeout=60):
+        """Line-by-line reveal frames for video export, rendered in the pool (not cached)"""
+        template = template or pick_template(text)
+        if self.workers > 0:
+            return self._pool().submit(render_reveal, text, template).result(timeout)
+        return render_reveal(text, template)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "renders": self.renders, "errors": self.errors,
+                    "cached": len(self._cache), "in_flight": len(self._in_flight)}
+
+
+card_renderer = CardRenderer.from_env()
+
+CARD_RENDERS = metrics.counter("wish_card_renders_total", "Image card requests by result", ["result"])
+CARD_RENDER_SECONDS = metrics.histogram("wish_card_render_seconds", "Image card render time in the process pool",
+                                        buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5))
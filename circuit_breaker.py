@@ -0,0 +1,110 @@
+import os, time, threading
+from wish_logging import log_event
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+RECOVERY_TIMEOUT = float(os.getenv("BREAKER_RECOVERY_TIMEOUT", "30"))
+HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker shared by every caller of one backend.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are rejected instantly. Once recovery_timeout has passed, up to
+    half_open_probes trial calls are let through; a success closes the
+    circuit, a failure opens it for another recovery_timeout.
+    """
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, recovery_timeout=RECOVERY_TIMEOUT,
+                 half_open_probes=HALF_OPEN_PROBES):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = max(1, half_open_probes)
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        if state != self.state:
+            # Never sampled or filtered out like debug lines; operators need every state change
+            log_event("circuit_state", level="warning", backend=self.name, from_state=self.state, to_state=state)
+            self.state = state
+        if state == OPEN:
+            self.opened_at = time.time()
+        if state == HALF_OPEN:
+            self._probes = 0
+        if state == CLOSED:
+            self.failures = 0
+
+    def allow(self):
+        """Reserve permission for one call; False means skip this backend"""
+        with self._lock:
+            if self.state == OPEN and time.time() - self.opened_at >= self.recovery_timeout:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes < self.half_open_probes:
+                    self._probes += 1
+                    return True
+            elif self.state == CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._transition(OPEN)
+
+    def release(self):
+        """Give back a probe whose call was abandoned without an outcome"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def call(self, fn, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpenError(f"circuit {self.name} is open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record_success()
+        return result
+
+    async def acall(self, coro_fn, *args, **kwargs):
+        """Async counterpart of call() for coroutines on the async engine"""
+        if not self.allow():
+            raise CircuitOpenError(f"circuit {self.name} is open")
+        try:
+            result = await coro_fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
@@ -0,0 +1,85 @@
+import os, asyncio, httpx
+
+# Pool and timeout settings for model backends
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))
+RETRY_STATUSES = (502, 503, 504)
+# Never reached the server: a refused connection, or a dead host that never answers the SYN
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+# Clients live on the async engine loop and are created on first use there
+_client = None
+_openai_client = None
+_stats = {"connections_opened": 0, "requests": 0}
+
+
+def timeouts():
+    """Separate connect and read timeouts for model calls"""
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+async def _trace(event_name, info):
+    if event_name == "connection.connect_tcp.complete":
+        _stats["connections_opened"] += 1
+
+
+async def _on_request(request):
+    _stats["requests"] += 1
+    request.extensions["trace"] = _trace
+
+
+def get_client():
+    """Keep-alive async client for model backends, created on first use"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=timeouts(),
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+            event_hooks={"request": [_on_request]},
+        )
+    return _client
+
+
+def get_openai_client():
+    """Async OpenAI client reusing its own httpx connection pool"""
+    global _openai_client
+    if _openai_client is None:
+        from openai import AsyncOpenAI, Timeout
+        _openai_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY", ""),
+            timeout=Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            max_retries=RETRIES,
+        )
+    return _openai_client
+
+
+async def post(url, json):
+    """POST through the shared pool, returning an open streaming response.
+
+    Connection failures and gateway errors are retried with exponential
+    backoff. Read timeouts are not: retrying would repeat a full generation
+    on an already slow model. The caller must close the response.
+    """
+    client = get_client()
+    for attempt in range(RETRIES + 1):
+        last_attempt = attempt == RETRIES
+        try:
+            response = await client.send(client.build_request("POST", url, json=json), stream=True)
+        except CONNECT_ERRORS:
+            if last_attempt:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                return response
+            await response.aclose()
+        await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+
+
+def pool_stats():
+    """Connection reuse counters for the shared pool"""
+    stats = dict(_stats)
+    stats["reused"] = max(0, stats["requests"] - stats["connections_opened"])
+    return stats
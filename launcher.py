@@ -0,0 +1,257 @@
+"""Run the Streamlit app as N supervised workers sharing one box-wide cache, scheduler and metrics endpoint.
+
+Usage:
+    python launcher.py --workers 4
+    python launcher.py --workers 4 --ensure-ollama
+    python launcher.py --workers 4 --print-nginx > /etc/nginx/snippets/wish_ui.conf
+
+Workers listen on consecutive ports from --port and need sticky routing
+(a Streamlit session lives in one process), so nginx hashes on the client
+address; --print-nginx writes the matching upstream. Every worker:
+  - shares the wish cache and skeletons through the SQLite store (WISH_STORE_PATH)
+  - takes Ollama generation slots from one set of lock files (WISH_SHARED_SLOTS_DIR),
+    so WISH_MAX_IN_FLIGHT (per Ollama host) caps the whole box, not each worker
+  - serves its own metrics sidecar; --metrics-port merges them with a worker label
+A worker that exits is restarted with backoff. Ctrl+C or SIGTERM stops them all.
+"""
+import argparse, json, os, signal, subprocess, sys, tempfile, threading, time, urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKERS = int(os.getenv("WISH_WORKERS", str(os.cpu_count() or 1)))
+BASE_PORT = int(os.getenv("WISH_BASE_PORT", "8501"))
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434").rstrip("/")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
+
+
+class Worker:
+    """One `streamlit run app.py` process and its restart bookkeeping"""
+
+    def __init__(self, index, port, metrics_port, env):
+        self.index = index
+        self.port = port
+        self.metrics_port = metrics_port
+        self.env = env
+        self.address = "127.0.0.1"
+        self.process = None
+        self.restarts = 0
+        self.next_start = 0
+
+    def start(self, address):
+        command = [sys.executable, "-m", "streamlit", "run", os.path.join(APP_DIR, "app.py"),
+                   "--server.port", str(self.port), "--server.address", address, "--server.headless", "true"]
+        self.address = "127.0.0.1" if address in ("0.0.0.0", "") else address
+        self.process = subprocess.Popen(command, cwd=APP_DIR, env=self.env)
+        print(f"  ▶️  worker {self.index} on :{self.port} (pid {self.process.pid})")
+
+    def check(self, address):
+        """Restart the worker if it exited, backing off on repeated crashes"""
+        if self.process.poll() is None:
+            return
+        now = time.time()
+        if not self.next_start:
+            delay = min(30, 2 ** self.restarts)
+            self.next_start = now + delay
+            print(f"  ✗ worker {self.index} exited with {self.process.returncode}; restarting in {delay}s")
+        elif now >= self.next_start:
+            self.restarts += 1
+            self.next_start = 0
+            self.start(address)
+
+    def healthy(self):
+        try:
+            with urllib.request.urlopen(f"http://{self.address}:{self.port}/_stcore/health", timeout=2) as r:
+                return r.status == 200
+        except OSError:
+            return False
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+
+
+def worker_env(index, metrics_port, store_path, slots_dir):
+    env = dict(os.environ)
+    env.update(WISH_WORKER_ID=str(index), METRICS_HOST="127.0.0.1", METRICS_PORT=str(metrics_port),
+               WISH_STORE_PATH=store_path, WISH_SHARED_SLOTS_DIR=slots_dir)
+    return env
+
+
+def merge_metrics(texts):
+    """Combine worker exposition texts into one, adding a worker label to every sample"""
+    families = {}  # name -> (header lines, sample lines), in first-seen order
+    for worker, text in texts:
+        current = None
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith("#"):
+                parts = line.split()
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    current = parts[2]
+                    headers, _ = families.setdefault(current, ([], []))
+                    if line not in headers:
+                        headers.append(line)
+                continue
+            name, brace, rest = line.partition("{")
+            if brace:
+                sample = f'{name}{{worker="{worker}",{rest}'
+            else:
+                name, _, value = line.partition(" ")
+                sample = f'{name}{{worker="{worker}"}} {value}'
+            families.setdefault(current or name, ([], []))[1].append(sample)
+    lines = []
+    for headers, samples in families.values():
+        lines.extend(headers)
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics_proxy(port, workers):
+    """Serve every worker's /metrics on one port, so Prometheus scrapes a single target"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            texts, up = [], []
+            for worker in workers:
+                up.append(f'wish_worker_up{{worker="{worker.index}"}} {int(worker.healthy())}')
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{worker.metrics_port}/metrics", timeout=2) as r:
+                        texts.append((worker.index, r.read().decode("utf-8")))
+                except OSError:
+                    pass  # The sidecar starts with the worker's first session
+            body = ("# HELP wish_worker_up 1 if the worker answers Streamlit's health check\n# TYPE wish_worker_up gauge\n"
+                    + "\n".join(up) + "\n" + merge_metrics(texts)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-proxy", daemon=True).start()
+    return server
+
+
+def ollama_up():
+    try:
+        with urllib.request.urlopen(f"{OLLAMA_HOST}/api/version", timeout=2):
+            return True
+    except OSError:
+        return False
+
+
+def ensure_ollama():
+    """Start a local Ollama and pull the model if needed (what start_with_ollama.sh used to do)"""
+    if not ollama_up():
+        print("⚙️  Starting Ollama server...")
+        try:
+            subprocess.Popen(["ollama", "serve"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            sys.exit("❌ Ollama not found; install it from https://ollama.ai/download")
+        for _ in range(30):
+            if ollama_up():
+                break
+            time.sleep(1)
+        else:
+            sys.exit("❌ Ollama failed to start in time")
+    with urllib.request.urlopen(f"{OLLAMA_HOST}/api/tags", timeout=5) as r:
+        models = [m.get("name", "") for m in json.load(r).get("models", [])]
+    if not any(name.split(":")[0] == OLLAMA_MODEL.split(":")[0] for name in models):
+        print(f"📥 Pulling {OLLAMA_MODEL} (this may take a few minutes)...")
+        subprocess.run(["ollama", "pull", OLLAMA_MODEL], check=True)
+    print(f"✅ Ollama ready at {OLLAMA_HOST} with {OLLAMA_MODEL}")
+
+
+def nginx_config(address, ports):
+    servers = "\n".join(f"    server {address}:{port};" for port in ports)
+    return f"""# Streamlit workers started by launcher.py. Sessions live in one worker, so
+# route each client to the same one; websockets need the upgrade headers.
+upstream wish_ui {{
+    hash $remote_addr consistent;
+{servers}
+}}
+
+map $http_upgrade $connection_upgrade {{
+    default upgrade;
+    ''      close;
+}}
+
+# Inside your server {{ }} block:
+location / {{
+    proxy_pass http://wish_ui;
+    proxy_http_version 1.1;
+    proxy_set_header Upgrade $http_upgrade;
+    proxy_set_header Connection $connection_upgrade;
+    proxy_set_header Host $host;
+    proxy_set_header X-Real-IP $remote_addr;
+    proxy_read_timeout 86400;
+}}
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run N supervised Streamlit workers for the wish maker")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="default: WISH_WORKERS or the CPU count")
+    parser.add_argument("--port", type=int, default=BASE_PORT, help="first worker port; the rest follow")
+    parser.add_argument("--address", default="127.0.0.1", help="bind address (keep nginx in front)")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT", "9464")),
+                        help="merged /metrics for all workers, 0 = none; workers use the ports after it")
+    parser.add_argument("--store", default=os.getenv("WISH_STORE_PATH") or os.path.join(APP_DIR, "wish_store.db"),
+                        help="shared SQLite store for cache and skeletons")
+    parser.add_argument("--slots-dir", default=os.getenv("WISH_SHARED_SLOTS_DIR") or None,
+                        help="lock files for box-wide generation slots (default: a temp dir per --port)")
+    parser.add_argument("--ensure-ollama", action="store_true", help="start Ollama and pull the model if needed")
+    parser.add_argument("--print-nginx", action="store_true", help="print the nginx upstream for these workers and exit")
+    args = parser.parse_args()
+
+    count = max(1, args.workers)
+    ports = [args.port + i for i in range(count)]
+    if args.print_nginx:
+        print(nginx_config(args.address, ports), end="")
+        return
+    if args.ensure_ollama:
+        ensure_ollama()
+
+    slots_dir = args.slots_dir or os.path.join(tempfile.gettempdir(), f"wishmaker-slots-{args.port}")
+    metrics_base = args.metrics_port or 9464
+    workers = [Worker(i, port, metrics_base + 1 + i, worker_env(i, metrics_base + 1 + i, args.store, slots_dir))
+               for i, port in enumerate(ports)]
+
+    if args.metrics_port:
+        start_metrics_proxy(args.metrics_port, workers)
+        print(f"📊 Merged metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+
+    print(f"🪔 Starting {count} workers (store {args.store}, slots {slots_dir})")
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    try:
+        for worker in workers:
+            worker.start(args.address)
+        while not stopping:
+            time.sleep(1)
+            for worker in workers:
+                worker.check(args.address)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("\n⏹️  Stopping workers...")
+        for worker in workers:
+            worker.stop()
+        deadline = time.time() + 10
+        for worker in workers:
+            if worker.process:
+                try:
+                    worker.process.wait(max(0.1, deadline - time.time()))
+                except subprocess.TimeoutExpired:
+                    worker.process.kill()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Load test: N concurrent sessions against the mock Ollama, reporting throughput and tail latency.
+
+Usage:
+    python loadtest.py --sessions 50 --mode engine --output bench/before.json
+    python loadtest.py --sessions 10 --mode ui --latency 0.5 --token-rate 30 --failure-rate 0.05
+    python loadtest.py --sessions 50 --output bench/after.json --compare bench/before.json
+
+engine mode calls the generation core behind generate_wish_with_ai from one
+thread per session; ui mode drives the full Streamlit main() through the
+six-step form with AppTest. Results are written as JSON for later comparison.
+"""
+import argparse, json, os, random, subprocess, sys, threading, time
+
+SENDERS = ["Raj", "Aarav", "Meera", "Kabir", "Ananya", "Vikram", "Isha", "Rohan", "Sara", "Dev"]
+RECIPIENTS = ["Priya", "Arjun", "Neha", "Kiran", "Maya", "Rahul", "Zoya", "Tara", "Nikhil", "Diya"]
+PASSIONS = ["music", "cricket", "painting", "cooking", "travel", "coding", "dance", "books", "yoga", "photography"]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile; None for no samples"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+def rss_bytes():
+    """Current resident set size; metrics is imported here, after main() has set the environment"""
+    from metrics import rss_bytes as current_rss
+    return current_rss()
+
+
+def random_form(rng, relationships, traits, languages):
+    return {
+        "sender_name": rng.choice(SENDERS),
+        "recipient_name": rng.choice(RECIPIENTS),
+        "relationship": rng.choice(relationships),
+        "traits": rng.sample(traits, rng.randint(1, 3)),
+        "life_thing": rng.choice(PASSIONS),
+        "language": rng.choice(languages),
+    }
+
+
+def summarize(latencies, errors, elapsed, sessions, rss_before, rss_after):
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else None,
+        "latency_s": {name: (round(value, 4) if value is not None else None) for name, value in (
+            ("p50", percentile(latencies, 50)), ("p95", percentile(latencies, 95)),
+            ("p99", percentile(latencies, 99)), ("max", max(latencies) if latencies else None))},
+        "memory_per_session_kb": round((rss_after - rss_before) / 1024 / max(1, sessions), 1),
+    }
+
+
+def run_engine(args, rng):
+    """Each session thread walks the form (think time per step) and generates wishes"""
+    from wish_engine import generate_wish, RELATIONSHIPS, TRAITS, LANGUAGES
+    latencies, errors, lock = [], [0], threading.Lock()
+    forms = [[random_form(rng, RELATIONSHIPS, TRAITS, args.languages or LANGUAGES) for _ in range(args.wishes)]
+             for _ in range(args.sessions)]
+
+    def session(forms):
+        for form in forms:
+            time.sleep(args.step_delay * 6)
+            started = time.time()
+            try:
+                generate_wish(**form)
+            except Exception as e:
+                print(f"  ✗ {type(e).__name__}: {e}", file=sys.stderr)
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                latencies.append(time.time() - started)
+
+    rss_before = rss_bytes()
+    started = time.time()
+    threads = [threading.Thread(target=session, args=(f,), daemon=True) for f in forms]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, errors[0], time.time() - started, args.sessions, rss_before, rss_bytes())
+
+
+def ui_session(app_path, form, step_delay, timeout):
+    """Walk the six-step form in a fresh AppTest; runs in its own worker process"""
+    from streamlit.testing.v1 import AppTest
+    rss_before = rss_bytes()
+    session_started = time.time()
+    at = AppTest.from_file(app_path, default_timeout=timeout).run()
+    for key in ("sender_name", "recipient_name"):
+        at.text_input(key=key).input(form[key]).run()
+        time.sleep(step_delay)
+    at.selectbox(key="relationship").select(form["relationship"]).run()
+    time.sleep(step_delay)
+    at.multiselect(key="traits").select(form["traits"][0]).run()
+    time.sleep(step_delay)
+    at.text_input(key="life_thing").input(form["life_thing"]).run()
+    time.sleep(step_delay)
+    at.radio(key="language").set_value(form["language"]).run()
+    time.sleep(step_delay)
+    started = time.time()
+    at.button[0].click().run()
+    elapsed = time.time() - started
+    if at.exception or not at.session_state.wish.wish_text:
+        raise RuntimeError(f"no wish generated: {at.exception}")
+    return {"latency": elapsed, "session": time.time() - session_started,
+            "script_runs": at.session_state.wish.script_runs, "rss_delta": rss_bytes() - rss_before}
+
+
+def run_ui(args, rng):
+    """Each session is a full Streamlit AppTest walking the six-step form.
+
+    AppTest swaps a process-global mock runtime in and out on every run, so
+    concurrent sessions each get a worker process. They share the model
+    server, but not the in-process cache, scheduler or single-flight.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import multiprocessing
+    from wish_engine import RELATIONSHIPS, TRAITS, LANGUAGES
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    forms = [random_form(rng, RELATIONSHIPS, TRAITS, args.languages or LANGUAGES) for _ in range(args.sessions)]
+    sessions, errors = [], 0
+
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=args.sessions, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(ui_session, app_path, form, args.step_delay, args.timeout) for form in forms]
+        for future in as_completed(futures):
+            try:
+                sessions.append(future.result())
+            except Exception as e:
+                print(f"  ✗ {type(e).__name__}: {e}", file=sys.stderr)
+                errors += 1
+    elapsed = time.time() - started
+
+    rss = sum(s["rss_delta"] for s in sessions)
+    result = summarize([s["latency"] for s in sessions], errors, elapsed, len(sessions), 0, rss)
+    walks = [s["session"] for s in sessions]
+    result["session_s"] = {"p50": round(percentile(walks, 50), 4), "p95": round(percentile(walks, 95), 4)} if walks else None
+    result["script_runs_per_session"] = round(sum(s["script_runs"] for s in sessions) / len(sessions), 1) if sessions else None
+    return result
+
+
+def component_stats():
+    from wish_engine import WISH_LATENCY, wish_cache, skeleton_pool, generation_scheduler, wish_flights, pool_stats
+    return {
+        "served_by": {key[0]: count for key, count in WISH_LATENCY.counts().items()},
+        "cache": wish_cache.stats(),
+        "skeletons": skeleton_pool.stats(),
+        "scheduler": generation_scheduler.stats(),
+        "singleflight": wish_flights.stats(),
+        "http_pool": pool_stats(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline_path):
+    """Print headline deltas against an earlier results file"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\n📊 vs {baseline_path} ({baseline['run'].get('git_commit')})")
+    for mode in ("engine", "ui"):
+        if mode not in current or mode not in baseline:
+            continue
+        old, new = baseline[mode], current[mode]
+        rows = [("throughput_rps", old["throughput_rps"], new["throughput_rps"])]
+        rows += [(f"latency {p}", old["latency_s"][p], new["latency_s"][p]) for p in ("p50", "p95", "p99")]
+        rows.append(("memory_per_session_kb", old["memory_per_session_kb"], new["memory_per_session_kb"]))
+        for name, before, after in rows:
+            change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else "n/a"
+            print(f"  {mode:6} {name:22} {before} -> {after} ({change})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the wish pipeline against the mock Ollama")
+    parser.add_argument("--mode", choices=["engine", "ui", "both"], default="engine")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--wishes", type=int, default=1, help="wishes per session (engine mode)")
+    parser.add_argument("--step-delay", type=float, default=0.0, help="think time per form step, seconds")
+    parser.add_argument("--languages", nargs="+", default=None)
+    parser.add_argument("--latency", default="lognormal:0.2,0.3", help="stub: time to first token (see mock_ollama.py)")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="stub: tokens per second")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="stub: fraction of HTTP 500s")
+    parser.add_argument("--errors", default="", help="stub: error injection, e.g. 503=0.05,drop=0.01")
+    parser.add_argument("--scenario", default=None, help="stub: JSON file with timed setting phases")
+    parser.add_argument("--ollama-host", default=None, help="use this Ollama instead of starting the stub")
+    parser.add_argument("--skeletons", action="store_true", help="leave the skeleton pool at its configured setting")
+    parser.add_argument("--timeout", type=float, default=120, help="ui mode: per-run AppTest timeout")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="loadtest_results.json", help="machine-readable results file")
+    parser.add_argument("--compare", default=None, help="earlier results file to diff against")
+    args = parser.parse_args()
+
+    mock = None
+    if not args.ollama_host:
+        from mock_ollama import MockOllamaServer, load_scenario
+        mock = MockOllamaServer(latency=args.latency, token_rate=args.token_rate, failure_rate=args.failure_rate,
+                                errors=args.errors, scenario=load_scenario(args.scenario), seed=args.seed,
+                                hang_seconds=30).start()
+        args.ollama_host = mock.url
+
+    # Backends read their settings at import time, so configure before importing the app
+    os.environ["OLLAMA_HOST"] = args.ollama_host
+    os.environ.pop("OLLAMA_HOSTS", None)
+    os.environ.setdefault("WISH_BACKENDS", "ollama")
+    os.environ.setdefault("METRICS_PORT", "0")
+    os.environ.setdefault("WISH_LOG_LEVEL", "warning")
+    if not args.skeletons:
+        os.environ["WISH_SKELETONS"] = "0"
+
+    rng = random.Random(args.seed)
+    print(f"🧪 {args.sessions} sessions, mode {args.mode}, Ollama {args.ollama_host}")
+    results = {"run": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "git_commit": git_commit(),
+                       "args": vars(args)}}
+    if args.mode in ("engine", "both"):
+        results["engine"] = run_engine(args, rng)
+        print(f"  engine: {json.dumps(results['engine'])}")
+    if args.mode in ("ui", "both"):
+        results["ui"] = run_ui(args, rng)
+        print(f"  ui:     {json.dumps(results['ui'])}")
+    results["components"] = component_stats()
+    if mock:
+        results["mock"] = dict(mock.stats)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
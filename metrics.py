@@ -0,0 +1,205 @@
+import os, bisect, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from wish_logging import debug_log
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # 0 disables the sidecar endpoint
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Mirror a running total a component already keeps; for scrape-time collectors"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def counts(self):
+        """Observation count per label tuple"""
+        with self._lock:
+            return {key: sum(counts) for key, (counts, _) in self._values.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:g}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metrics plus collectors that refresh gauges and totals from component stats at scrape time"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, help, labelnames=(), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def add_collector(self, fn):
+        """fn() is called before every scrape to update gauges and mirrored totals"""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def render(self):
+        for collect in list(self._collectors):
+            try:
+                collect()
+            except Exception as e:
+                debug_log(f"Metrics collector {getattr(collect, '__name__', collect)} failed: {e}")
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
+add_collector = registry.add_collector
+
+
+def rss_bytes():
+    """Current resident set size (falls back to peak RSS off Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would drown journalctl
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Serve /metrics on a localhost sidecar thread, once per process"""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                debug_log(f"Metrics endpoint not started on {host}:{port}: {e}")
+                _server = False
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+            debug_log(f"📊 Metrics on http://{host}:{port}/metrics")
+    return _server or None
@@ -0,0 +1,348 @@
+"""Offline stand-in for Ollama and OpenAI: scriptable latency, token rate, errors and canned wishes.
+
+Usage:
+    python mock_ollama.py --port 11435 --latency lognormal:0.3,0.5 --token-rate 40 --errors 500=0.02,drop=0.01
+    OLLAMA_HOST=http://127.0.0.1:11435 OPENAI_BASE_URL=http://127.0.0.1:11435/v1 OPENAI_API_KEY=mock streamlit run app.py
+
+Endpoints: /api/generate (streaming NDJSON and non-streaming), /api/tags and
+/v1/chat/completions (SSE streaming and non-streaming). Wishes come from
+canned English/Hindi/Hinglish texts with the names and passion from the
+prompt filled in, or placeholders when a skeleton template is requested.
+
+Latency specs: 0.3 | fixed:0.3 | normal:MEAN,SD | lognormal:MEDIAN,SIGMA | uniform:LO,HI | exp:MEAN
+Error specs: comma separated KIND=PROBABILITY with KIND one of
+    500, 503 (HTTP error), hang (never answer), drop (cut the stream), garbage (malformed JSON)
+
+A scenario file changes settings over time, e.g. an outage after a minute:
+    {"phases": [{"after": 0, "latency": "lognormal:0.3,0.5"},
+                {"after": 60, "errors": "503=1.0"},
+                {"after": 90, "errors": "", "token_rate": 20}]}
+
+With --seed the same request sequence gets the same latencies, errors and texts.
+"""
+import argparse, json, math, random, re, threading, time, uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CANNED_WISHES = {
+    "English": [
+        "Dear {recipient} 🪔✨ Happy Diwali! May your love for {passion} light up the year like a thousand diyas 🎆💫 "
+        "Your {traits} spirit makes every festival brighter 🌟🎇 With love, {sender}",
+        "Happy Diwali, {recipient}! 🪔 May this festival of lights fill your days with {passion} and joy ✨🎆 "
+        "Stay as {traits} as ever 💫🌟🎇 Warm wishes, {sender}",
+        "{recipient}, wishing you a sparkling Diwali 🎇✨ May {passion} keep bringing you happiness and your "
+        "{traits} heart shine brighter than the diyas 🪔🎆💫🌟 — {sender}",
+    ],
+    "Hindi": [
+        "प्रिय {recipient} 🪔✨ दीपावली की हार्दिक शुभकामनाएं! आपका {passion} के प्रति प्रेम इस साल हज़ार दीयों की तरह "
+        "चमके 🎆💫 आपका {traits} स्वभाव हर त्योहार को रोशन करता है 🌟🎇 स्नेह सहित, {sender}",
+        "{recipient}, शुभ दीपावली! 🪔 रोशनी का यह पर्व आपके जीवन में {passion} और खुशियां भर दे ✨🎆 "
+        "हमेशा ऐसे ही {traits} बने रहें 💫🌟🎇 शुभकामनाओं सहित, {sender}",
+        "प्रिय {recipient}, दीवाली मुबारक 🎇✨ {passion} आपको यूं ही खुशियां देता रहे और आपका {traits} दिल दीयों से "
+        "भी ज़्यादा चमके 🪔🎆💫🌟 — {sender}",
+    ],
+    "Hinglish": [
+        "Dear {recipient} 🪔✨ Happy Diwali yaar! Tumhara {passion} ka pyaar is saal hazaar diyon ki tarah chamke 🎆💫 "
+        "Tumhari {traits} vibe har tyohaar ko roshan kar deti hai 🌟🎇 Dher saara pyaar, {sender}",
+        "{recipient}, Diwali mubarak! 🪔 Yeh roshni ka tyohaar tumhari life mein {passion} aur khushiyan bhar de ✨🎆 "
+        "Hamesha aise hi {traits} rehna 💫🌟🎇 Best wishes, {sender}",
+        "Hey {recipient} 🎇✨ Is Diwali {passion} tumhe aur bhi khushiyan de aur tumhara {traits} dil diyon se zyada "
+        "chamke 🪔🎆💫🌟 — tumhara {sender}",
+    ],
+}
+
+ERROR_KINDS = ("500", "503", "hang", "drop", "garbage")
+
+
+def parse_distribution(spec):
+    """Turn a latency spec into a sampler taking a random.Random and returning seconds"""
+    spec = str(spec).strip()
+    kind, _, params = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+    values = [float(v) for v in params.split(",") if v.strip()]
+    samplers = {
+        "fixed": lambda rng: values[0],
+        "normal": lambda rng: rng.gauss(values[0], values[1]),
+        "lognormal": lambda rng: rng.lognormvariate(math.log(values[0]), values[1]),
+        "uniform": lambda rng: rng.uniform(values[0], values[1]),
+        "exp": lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0,
+    }
+    if kind not in samplers:
+        raise ValueError(f"unknown latency distribution {kind!r} (use one of {', '.join(samplers)})")
+    sampler = samplers[kind]
+    sampler(random.Random(0))  # Fail fast on missing parameters
+    return lambda rng: max(0.0, sampler(rng))
+
+
+def parse_errors(spec):
+    """'500=0.02,drop=0.01' -> [('500', 0.02), ('drop', 0.01)]"""
+    errors = []
+    for part in filter(None, (p.strip() for p in str(spec or "").split(","))):
+        kind, _, probability = part.partition("=")
+        if kind not in ERROR_KINDS:
+            raise ValueError(f"unknown error kind {kind!r} (use one of {', '.join(ERROR_KINDS)})")
+        errors.append((kind, float(probability)))
+    return errors
+
+
+def _field(prompt, label, default):
+    match = re.search(rf"^- {label}: (.+)$", prompt, re.MULTILINE)
+    return match.group(1).strip() if match else default
+
+
+def canned_wish(prompt, rng=random):
+    """A plausible wish in the prompt's language, or a skeleton when placeholders were requested"""
+    match = re.search(r"Write a Diwali wish (?:TEMPLATE )?in (\w+)", prompt)
+    language = match.group(1) if match and match.group(1) in CANNED_WISHES else "English"
+    template = rng.choice(CANNED_WISHES[language])
+    traits = _field(prompt, "Their traits", "wonderful")
+    if "<<SENDER>>" in prompt:
+        return template.format(recipient="<<RECIPIENT>>", passion="<<PASSION>>", sender="<<SENDER>>", traits=traits)
+    return template.format(recipient=_field(prompt, "To", "friend"), passion=_field(prompt, "Their passion", "life"),
+                           sender=_field(prompt, "From", "me"), traits=traits)
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockOllama/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": self.server.model}]})
+        elif self.path == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": self.server.model, "object": "model"}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            self._post()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (a lost hedge, a timeout, a cancelled speculation)
+            self.close_connection = True
+
+    def _post(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path == "/api/generate":
+            prompt = body.get("prompt", "")
+            stream = body.get("stream", True)
+        elif self.path == "/v1/chat/completions":
+            prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+            stream = body.get("stream", False)
+        else:
+            self._send_json(404, {"error": "not found"})
+            return
+
+        plan = self.server.plan(prompt)
+        time.sleep(plan["latency"])
+        if plan["error"] == "hang":
+            time.sleep(self.server.hang_seconds)
+            self.close_connection = True
+            return
+        if plan["error"] in ("500", "503"):
+            self._send_json(int(plan["error"]), {"error": {"message": f"injected {plan['error']}"}})
+            return
+        if plan["error"] == "drop" and not stream:
+            self.close_connection = True
+            return
+
+        if self.path == "/api/generate":
+            self._ollama(body, prompt, stream, plan)
+        else:
+            self._openai(body, prompt, stream, plan)
+
+    def _emit_tokens(self, plan, write):
+        """Write tokens at the planned rate; False if the stream was cut short"""
+        tokens = plan["tokens"]
+        cut = len(tokens) // 2 if plan["error"] == "drop" else None
+        for i, token in enumerate(tokens):
+            if i == cut:
+                self.close_connection = True
+                return False
+            if plan["error"] == "garbage" and i == 1:
+                self._write_chunk(b"{not json\n")
+            time.sleep(plan["token_delay"])
+            write(token)
+        return True
+
+    def _ollama(self, body, prompt, stream, plan):
+        model = body.get("model", self.server.model)
+        counts = {"prompt_eval_count": len(prompt) // 4, "eval_count": len(plan["tokens"])}
+        if not stream:
+            time.sleep(plan["token_delay"] * len(plan["tokens"]))
+            if plan["error"] == "garbage":
+                self.send_response(200)
+                self.send_header("Content-Length", "9")
+                self.end_headers()
+                self.wfile.write(b"{not json")
+                return
+            self._send_json(200, {"model": model, "response": "".join(plan["tokens"]), "done": True, **counts})
+            return
+
+        self._start_chunked("application/x-ndjson")
+        line = lambda payload: self._write_chunk((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+        if self._emit_tokens(plan, lambda token: line({"model": model, "response": token, "done": False})):
+            line({"model": model, "response": "", "done": True, **counts})
+            self._end_chunked()
+
+    def _openai(self, body, prompt, stream, plan):
+        model = body.get("model", self.server.model)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(plan["tokens"]),
+                 "total_tokens": len(prompt) // 4 + len(plan["tokens"])}
+        if not stream:
+            time.sleep(plan["token_delay"] * len(plan["tokens"]))
+            if plan["error"] == "garbage":
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", "9")
+                self.end_headers()
+                self.wfile.write(b"{not json")
+                return
+            self._send_json(200, {"id": completion_id, "object": "chat.completion", "created": int(time.time()),
+                                  "model": model, "usage": usage, "choices": [{
+                                      "index": 0, "finish_reason": "stop",
+                                      "message": {"role": "assistant", "content": "".join(plan["tokens"])}}]})
+            return
+
+        def event(delta, finish_reason=None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        self._start_chunked("text/event-stream")
+        event({"role": "assistant", "content": ""})
+        if self._emit_tokens(plan, lambda token: event({"content": token})):
+            event({}, "stop")
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._end_chunked()
+
+
+class MockOllamaServer(ThreadingHTTPServer):
+    """Threaded mock whose settings can be changed while it runs (directly or by a scenario)"""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency="0.2", token_rate=40.0, failure_rate=0.0,
+                 errors="", scenario=None, seed=None, hang_seconds=600.0, model="llama3.2"):
+        super().__init__((host, port), MockOllamaHandler)
+        self.base = {"latency": str(latency), "token_rate": float(token_rate),
+                     "errors": ",".join(filter(None, [f"500={failure_rate}" if failure_rate else "", errors]))}
+        self.phases = sorted((scenario or {}).get("phases", []), key=lambda p: p.get("after", 0))
+        self.hang_seconds = hang_seconds
+        self.model = model
+        self.stats = {"requests": 0, **{kind: 0 for kind in ERROR_KINDS}}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._compiled = {}
+        self.settings()  # Validate specs up front
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def update(self, **settings):
+        """Change latency/token_rate/errors for subsequent requests"""
+        with self._lock:
+            self.base.update({k: v for k, v in settings.items() if v is not None})
+
+    def settings(self):
+        """Base settings overlaid with every scenario phase that has started"""
+        elapsed = time.time() - self._started
+        current = dict(self.base)
+        for phase in self.phases:
+            if phase.get("after", 0) <= elapsed:
+                current.update({k: v for k, v in phase.items() if k != "after"})
+        key = (str(current["latency"]), str(current["errors"]))
+        if key not in self._compiled:
+            self._compiled[key] = (parse_distribution(current["latency"]), parse_errors(current["errors"]))
+        current["latency_fn"], current["error_list"] = self._compiled[key]
+        return current
+
+    def plan(self, prompt):
+        """Decide latency, injected error and output for one request (under one lock for --seed)"""
+        with self._lock:
+            settings = self.settings()
+            rng = self._rng
+            self.stats["requests"] += 1
+            error = None
+            roll = rng.random()
+            for kind, probability in settings["error_list"]:
+                if roll < probability:
+                    error = kind
+                    self.stats[kind] += 1
+                    break
+                roll -= probability
+            token_rate = float(settings["token_rate"])
+            return {
+                "latency": settings["latency_fn"](rng),
+                "error": error,
+                "tokens": re.findall(r"\S+\s*", canned_wish(prompt, rng)),
+                "token_delay": 1.0 / token_rate if token_rate > 0 else 0.0,
+            }
+
+    def start(self):
+        """Serve on a daemon thread and return self"""
+        threading.Thread(target=self.serve_forever, name="mock-ollama", daemon=True).start()
+        return self
+
+
+def load_scenario(path):
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama/OpenAI server for offline performance testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", default="lognormal:0.2,0.3", help="time to first token (see spec above)")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="tokens per second, 0 = instant")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="shorthand for --errors 500=RATE")
+    parser.add_argument("--errors", default="", help="error injection, e.g. 500=0.02,hang=0.01,drop=0.01")
+    parser.add_argument("--hang-seconds", type=float, default=600.0, help="how long 'hang' errors stall")
+    parser.add_argument("--scenario", default=None, help="JSON file with timed setting phases")
+    parser.add_argument("--seed", type=int, default=None, help="make latencies, errors and texts reproducible")
+    parser.add_argument("--model", default="llama3.2")
+    args = parser.parse_args()
+
+    server = MockOllamaServer(args.host, args.port, latency=args.latency, token_rate=args.token_rate,
+                              failure_rate=args.failure_rate, errors=args.errors,
+                              scenario=load_scenario(args.scenario), seed=args.seed,
+                              hang_seconds=args.hang_seconds, model=args.model)
+    print(f"🧪 Mock Ollama/OpenAI on {server.url} (latency {args.latency}, {args.token_rate} tok/s, "
+          f"errors {server.base['errors'] or 'none'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{server.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Offline batch job: pregenerate wish skeletons for every relationship x traits x language combo.
+
+Usage:
+    python pregenerate_skeletons.py --per-combo 3 --output skeletons.json
+
+The job is resumable: combinations that already have enough skeletons in the
+output file are skipped, and progress is saved every --save-every combos.
+"""
+import argparse, itertools, sys, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from wish_engine import RELATIONSHIPS, TRAITS, LANGUAGES, OLLAMA_HOSTS, OLLAMA_MODEL, generate_skeleton
+from skeletons import SkeletonPool
+
+
+def iter_combos(languages, max_traits):
+    """Yield every (relationship, traits, language) the form can submit"""
+    for language in languages:
+        for relationship in RELATIONSHIPS:
+            for size in range(1, max_traits + 1):
+                for traits in itertools.combinations(TRAITS, size):
+                    yield relationship, list(traits), language
+
+
+def fill_combo(pool, relationship, traits, language, per_combo, attempts):
+    """Generate skeletons for one combo until it holds per_combo of them"""
+    for _ in range(attempts):
+        if pool.count(relationship, traits, language) >= per_combo:
+            break
+        try:
+            pool.add(relationship, traits, language, generate_skeleton(relationship, traits, language))
+        except Exception as e:
+            print(f"  ✗ {relationship} / {', '.join(traits)} / {language}: {type(e).__name__} - {e}", file=sys.stderr)
+    return pool.count(relationship, traits, language)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pregenerate Diwali wish skeletons through Ollama")
+    parser.add_argument("--output", default="skeletons.json", help="pool file (read for resume, then updated)")
+    parser.add_argument("--per-combo", type=int, default=3, help="skeletons to keep per combination")
+    parser.add_argument("--languages", nargs="+", default=LANGUAGES, choices=LANGUAGES)
+    parser.add_argument("--max-traits", type=int, default=3, choices=[1, 2, 3])
+    parser.add_argument("--workers", type=int, default=1, help="parallel Ollama requests")
+    parser.add_argument("--attempts", type=int, default=6, help="max generations per combo (invalid outputs are retried)")
+    parser.add_argument("--save-every", type=int, default=25, help="save progress after this many combos")
+    parser.add_argument("--limit", type=int, default=0, help="only process the first N incomplete combos")
+    args = parser.parse_args()
+
+    pool = SkeletonPool(args.output)
+    loaded = pool.load()
+    combos = [c for c in iter_combos(args.languages, args.max_traits) if pool.count(*c) < args.per_combo]
+    if args.limit:
+        combos = combos[:args.limit]
+
+    print(f"🪔 Ollama: {', '.join(OLLAMA_HOSTS)} ({OLLAMA_MODEL})")
+    print(f"📦 Loaded {loaded} skeletons from {args.output}; {len(combos)} combos to fill")
+
+    started = time.time()
+    done = 0
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        futures = [executor.submit(fill_combo, pool, *combo, args.per_combo, args.attempts) for combo in combos]
+        for future in as_completed(futures):
+            future.result()
+            done += 1
+            if done % args.save_every == 0:
+                pool.save()
+                rate = done / (time.time() - started)
+                print(f"  ✓ {done}/{len(combos)} combos ({rate:.2f}/s) {pool.stats()}")
+        executor.shutdown()
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrupted, saving progress (re-run to resume)...")
+        executor.shutdown(wait=False, cancel_futures=True)
+    finally:
+        pool.save()
+
+    print(f"✅ Done in {time.time() - started:.0f}s: {pool.stats()}")
+
+
+if __name__ == "__main__":
+    main()
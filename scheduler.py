@@ -0,0 +1,254 @@
+import os, time, fcntl, threading
+from collections import deque
+from contextlib import contextmanager
+
+
+class QueueFull(Exception):
+    """Raised when a generation is shed instead of queued"""
+
+
+class SharedSlots:
+    """Generation slots shared by every worker process on the box.
+
+    Each slot is a lock file and holding its flock is holding the slot. The
+    kernel drops the lock when a worker dies, so a crash never leaks one.
+    A holder also writes its pid into the file, so occupancy can be read
+    without probing the locks (a probe would make a free slot look taken).
+    """
+
+    def __init__(self, directory, count, poll_interval=0.05):
+        self.directory = directory
+        self.count = count
+        self.poll_interval = poll_interval
+        os.makedirs(directory, exist_ok=True)
+        self._paths = [os.path.join(directory, f"slot-{i}.lock") for i in range(count)]
+
+    def _try(self, path):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, str(os.getpid()).encode(), 0)
+        return fd
+
+    def try_acquire(self):
+        """Lock a free slot file if there is one right now; returns its fd or None"""
+        for path in self._paths:
+            fd = self._try(path)
+            if fd is not None:
+                return fd
+        return None
+
+    def acquire(self, timeout, on_wait=None):
+        """Lock a free slot file, polling until timeout; returns its fd.
+
+        on_wait() is called once if every slot is busy and polling starts.
+        """
+        deadline = time.time() + timeout
+        waited = False
+        while True:
+            fd = self.try_acquire()
+            if fd is not None:
+                return fd
+            if time.time() >= deadline:
+                raise QueueFull(f"all {self.count} shared slots busy for {timeout:.0f}s")
+            if on_wait and not waited:
+                on_wait()
+                waited = True
+            time.sleep(self.poll_interval)
+
+    def release(self, fd):
+        os.ftruncate(fd, 0)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def in_use(self):
+        """Slots currently held by any worker, from the holders' pids"""
+        busy = 0
+        for path in self._paths:
+            try:
+                with open(path, "rb") as f:
+                    pid = int(f.read() or 0)
+            except (OSError, ValueError):
+                continue
+            # A crashed holder leaves its pid behind; the next holder overwrites it
+            if pid and _alive(pid):
+                busy += 1
+        return busy
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class GenerationScheduler:
+    """Global cap on in-flight model generations with a bounded FIFO wait queue.
+
+    With shared slots, a generation also needs one of the box-wide slot
+    files, so several worker processes together never exceed the cap.
+    """
+
+    def __init__(self, max_in_flight=2, max_queue=20, max_wait=45, shared=None):
+        self.max_in_flight = max_in_flight
+        self.shared = shared
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self._waiting = deque()
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        # WISH_MAX_IN_FLIGHT is per Ollama host, so every host added to OLLAMA_HOSTS adds capacity
+        hosts = [h for h in os.getenv("OLLAMA_HOSTS", "").split(",") if h.strip()]
+        max_in_flight = max(1, int(os.getenv("WISH_MAX_IN_FLIGHT", "2"))) * max(1, len(hosts))
+        # Set by launcher.py so every worker shares one cap on the local model
+        slots_dir = os.getenv("WISH_SHARED_SLOTS_DIR", "")
+        return cls(
+            max_in_flight=max_in_flight,
+            max_queue=int(os.getenv("WISH_MAX_QUEUE", "20")),
+            max_wait=float(os.getenv("WISH_QUEUE_TIMEOUT", "45")),
+            shared=SharedSlots(slots_dir, max_in_flight) if slots_dir else None,
+        )
+
+    @property
+    def queue_depth(self):
+        return len(self._waiting)
+
+    def acquire(self, on_position=None):
+        """Block until a generation slot is free; returns a token for release().
+
+        on_position(n) is called whenever the caller's place in line changes,
+        with 0 once the slot is granted. Raises QueueFull when the queue is
+        at its depth limit or the wait exceeds max_wait.
+        """
+        started = time.time()
+        self._acquire_local(on_position)
+        token = None
+        if self.shared:
+            # Other workers may hold the box-wide slots; wait out the rest of max_wait, next in line here
+            try:
+                token = self.shared.acquire(max(0.0, self.max_wait - (time.time() - started)),
+                                            on_wait=on_position and (lambda: on_position(1)))
+            except BaseException as e:
+                with self._cond:
+                    if isinstance(e, QueueFull):
+                        self.timed_out += 1
+                    self.in_flight -= 1
+                    self._cond.notify_all()
+                raise
+        if on_position:
+            try:
+                on_position(0)
+            except BaseException:
+                # A rerun can interrupt the callback (it touches the page); don't keep the slot
+                self.release(token)
+                raise
+        return token
+
+    def try_acquire(self):
+        """Take a slot only if one is free right now, without queueing: (acquired, token).
+
+        For optional work (hedges, background top-ups) that should never make
+        a waiting user wait longer.
+        """
+        with self._cond:
+            if self.in_flight >= self.max_in_flight or self._waiting:
+                return False, None
+            self.in_flight += 1
+        token = None
+        if self.shared:
+            token = self.shared.try_acquire()
+            if token is None:
+                with self._cond:
+                    self.in_flight -= 1
+                    self._cond.notify_all()
+                return False, None
+        with self._cond:
+            self.admitted += 1
+        return True, token
+
+    def _acquire_local(self, on_position):
+        with self._cond:
+            if self.in_flight < self.max_in_flight and not self._waiting:
+                self.in_flight += 1
+                self.admitted += 1
+                return
+            if len(self._waiting) >= self.max_queue:
+                self.shed += 1
+                raise QueueFull(f"queue full ({len(self._waiting)} waiting)")
+            ticket = object()
+            self._waiting.append(ticket)
+            deadline = time.time() + self.max_wait
+            last_position = None
+            try:
+                while True:
+                    if self._waiting[0] is ticket and self.in_flight < self.max_in_flight:
+                        self._waiting.popleft()
+                        self.in_flight += 1
+                        self.admitted += 1
+                        # Let the next waiter re-check in case more slots are free
+                        self._cond.notify_all()
+                        break
+                    position = self._waiting.index(ticket) + 1
+                    if on_position and position != last_position:
+                        on_position(position)
+                        last_position = position
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self._waiting.remove(ticket)
+                        self.timed_out += 1
+                        self._cond.notify_all()
+                        raise QueueFull(f"waited {self.max_wait:.0f}s at position {position}")
+                    self._cond.wait(min(remaining, 1.0))
+            except QueueFull:
+                raise
+            except BaseException:
+                # Script reruns can interrupt the wait; never leave a dead ticket behind
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    self._cond.notify_all()
+                raise
+
+    def release(self, token=None):
+        if token is not None:
+            self.shared.release(token)
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, on_position=None):
+        token = self.acquire(on_position)
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._waiting),
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "timed_out": self.timed_out,
+            }
+        if self.shared:
+            stats["shared_in_flight"] = self.shared.in_use()
+        return stats
+
+
+generation_scheduler = GenerationScheduler.from_env()
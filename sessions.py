@@ -0,0 +1,129 @@
+import os, sys, time, threading, weakref
+import metrics
+from wish_logging import debug_log, log_event, new_request_id
+
+# Idle-session reaper settings
+SESSION_TTL = float(os.getenv("WISH_SESSION_TTL", "900"))  # idle seconds before a session's state is dropped, 0 = never
+SESSION_REAP_INTERVAL = float(os.getenv("WISH_SESSION_REAP_INTERVAL", "60"))
+
+
+class WishSession:
+    """Everything the wish flow keeps for one browser session, in one slotted object.
+
+    Form values are not copied here: they live in their widgets, which
+    Streamlit drops on its own once the form stops rendering. Batch outcomes
+    are kept as (status, wish, error) tuples keyed by row number; the rest of
+    each output record is rebuilt from the uploaded CSV when needed.
+    """
+
+    __slots__ = ("session_id", "step", "wish_text", "script_runs", "assets_injected",
+                 "batch_id", "batch_results", "speculation", "video", "last_seen", "__weakref__")
+
+    def __init__(self, session_id=None):
+        self.session_id = session_id or new_request_id()
+        self.assets_injected = False
+        self.last_seen = time.time()
+        self.reset()
+
+    @property
+    def generated(self):
+        return bool(self.wish_text)
+
+    def reset(self):
+        """Back to an empty form; identity and page assets are kept"""
+        self.step = 0
+        self.wish_text = ""
+        self.script_runs = 0
+        self.batch_id = None
+        self.batch_results = {}
+        if getattr(self, "speculation", None):
+            self.speculation.discard()
+        self.speculation = None  # speculation.SpeculativeJob for the completed form, if any
+        self.video = None        # video.VideoJob for the current wish, if one was requested
+
+    def touch(self):
+        self.last_seen = time.time()
+
+    def footprint(self):
+        """Approximate bytes held by this session's own state"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.session_id) + sys.getsizeof(self.wish_text)
+        size += sys.getsizeof(self.batch_results)
+        for outcome in self.batch_results.values():
+            size += sys.getsizeof(outcome) + sum(sys.getsizeof(value) for value in outcome)
+        return size
+
+
+class SessionRegistry:
+    """Weak index of live sessions plus a daemon thread that evicts idle ones.
+
+    Streamlit closes sessions whose browser disconnected (server.disconnectedSessionTTL),
+    but a tab left open after sharing keeps its session forever. Those are
+    reset once idle past the TTL: the page keeps showing the wish, and the
+    next interaction simply starts a fresh form.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, interval=SESSION_REAP_INTERVAL):
+        self.ttl = ttl
+        self.interval = interval
+        self.evicted = 0
+        self._sessions = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def register(self, session):
+        with self._lock:
+            self._sessions[session.session_id] = session
+            if self._thread is None and self.ttl > 0:
+                self._thread = threading.Thread(target=self._reap_forever, name="wish-session-reaper", daemon=True)
+                self._thread.start()
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def reap(self, now=None):
+        """Reset sessions idle longer than the TTL; returns how many were evicted"""
+        now = now or time.time()
+        evicted = 0
+        for session in self.sessions():
+            if now - session.last_seen > self.ttl and (session.generated or session.batch_results or session.step
+                                                       or session.speculation):
+                idle = now - session.last_seen
+                session.reset()
+                evicted += 1
+                log_event("session_evicted", session_id=session.session_id, idle_s=round(idle))
+        self.evicted += evicted
+        return evicted
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reap()
+            except Exception as e:
+                debug_log(f"Session reaper failed: {type(e).__name__} - {e}")
+
+    def stats(self):
+        sessions = self.sessions()
+        now = time.time()
+        idle = sum(1 for s in sessions if now - s.last_seen > self.interval)
+        state_bytes = sum(s.footprint() for s in sessions)
+        return {"sessions": len(sessions), "idle": idle, "evicted": self.evicted, "state_bytes": state_bytes}
+
+
+def _collect_session_stats():
+    """Mirror the registry into gauges at scrape time"""
+    stats = session_registry.stats()
+    SESSIONS.set(stats["sessions"] - stats["idle"], state="active")
+    SESSIONS.set(stats["idle"], state="idle")
+    SESSIONS_EVICTED.set(stats["evicted"])
+    SESSION_STATE_BYTES.set(stats["state_bytes"] / max(1, stats["sessions"]))
+    MEMORY_PER_SESSION.set(metrics.rss_bytes() / max(1, stats["sessions"]))
+
+session_registry = SessionRegistry()
+
+SESSIONS = metrics.gauge("wish_sessions", "Live Streamlit sessions, by recent activity", ["state"])
+SESSIONS_EVICTED = metrics.counter("wish_sessions_evicted_total", "Idle sessions reset by the reaper")
+SESSION_STATE_BYTES = metrics.gauge("wish_session_state_bytes", "Average app-held state per live session")
+MEMORY_PER_SESSION = metrics.gauge("wish_memory_per_session_bytes", "Process RSS divided by live sessions")
+metrics.add_collector(_collect_session_stats)
@@ -0,0 +1,63 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution"""
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run fn once per key at a time; returns (result, shared).
+
+        Callers arriving while a call for key is in flight wait for it and
+        get its result (or exception) with shared=True. If the leader was
+        interrupted rather than failing (e.g. a Streamlit rerun stopped its
+        script), a waiting caller takes over as the new leader.
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self.leaders += 1
+                else:
+                    call.waiters += 1
+                    self.coalesced += 1
+            if leader:
+                try:
+                    call.result = fn()
+                    return call.result, False
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        del self._calls[key]
+                    call.done.set()
+            call.done.wait()
+            if call.error is None:
+                return call.result, True
+            if isinstance(call.error, Exception):
+                raise call.error
+            with self._lock:
+                self.coalesced -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+wish_flights = SingleFlight()
@@ -0,0 +1,193 @@
+import os, json, time, random, threading
+from concurrent.futures import ThreadPoolExecutor
+from scheduler import QueueFull
+from wish_cache import SENDER_TOKEN, RECIPIENT_TOKEN
+from wish_logging import debug_log
+from wish_store import wish_store
+
+PASSION_TOKEN = "<<PASSION>>"
+SKELETON_TOKENS = (SENDER_TOKEN, RECIPIENT_TOKEN, PASSION_TOKEN)
+
+
+def combo_key(relationship, traits, language):
+    """Key for one relationship x traits x language combination"""
+    traits_key = ",".join(sorted(t.strip().lower() for t in (traits or [])))
+    return f"{(relationship or '').lower()}|{traits_key}|{(language or 'English').lower()}"
+
+
+def fill_skeleton(skeleton, sender_name, recipient_name, life_thing):
+    """Fill the name and passion placeholders of a skeleton"""
+    return (skeleton.replace(SENDER_TOKEN, sender_name)
+                    .replace(RECIPIENT_TOKEN, recipient_name)
+                    .replace(PASSION_TOKEN, life_thing))
+
+
+def is_valid_skeleton(text):
+    return bool(text) and all(token in text for token in SKELETON_TOKENS)
+
+
+class SkeletonPool:
+    """Pregenerated placeholder wishes per combination, topped up in the background.
+
+    With a store, skeletons from the JSON file and from top-ups are also kept
+    on disk, and a combo that is empty here is re-read from it, so a top-up
+    in one worker serves every worker.
+    """
+
+    def __init__(self, path, target=5, max_pending=32, save_interval=60, enabled=True, store=None):
+        self.path = path
+        self.store = store if store is not None and store.enabled else None
+        self.target = target
+        self.max_pending = max_pending
+        self.save_interval = save_interval
+        self.enabled = enabled
+        self.generator = None  # callable(relationship, traits, language) -> skeleton text
+        self.hits = 0
+        self.misses = 0
+        self.top_ups = 0
+        self.rejected = 0
+        self.skipped_busy = 0
+        self._skeletons = {}
+        self._pending = set()
+        self._dirty = False
+        self._last_save = time.time()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @classmethod
+    def from_env(cls):
+        pool = cls(
+            path=os.getenv("WISH_SKELETON_FILE", "skeletons.json"),
+            target=max(1, int(os.getenv("WISH_SKELETON_TARGET", "5"))),
+            max_pending=int(os.getenv("WISH_SKELETON_MAX_PENDING", "32")),
+            store=wish_store,
+        )
+        # "auto" only serves skeletons once a pool file has been pregenerated (or stored)
+        mode = os.getenv("WISH_SKELETONS", "auto").lower()
+        stored = bool(pool.store and pool.store.skeletons())
+        pool.enabled = mode in ("1", "true", "on") or (mode == "auto" and (os.path.exists(pool.path) or stored))
+        if pool.enabled:
+            pool.load()
+            if pool.store:
+                pool.sync_store()
+        return pool
+
+    def _merge(self, skeletons):
+        with self._lock:
+            for key, items in skeletons.items():
+                bucket = self._skeletons.setdefault(key, [])
+                bucket.extend(s for s in items if is_valid_skeleton(s) and s not in bucket)
+            return sum(len(v) for v in self._skeletons.values())
+
+    def load(self, path=None):
+        """Load skeletons from the JSON pool file, if present"""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return self._merge(data.get("skeletons", {}))
+
+    def sync_store(self):
+        """Share the file's skeletons through the store and pick up every other worker's"""
+        with self._lock:
+            items = [(key, skeleton) for key, bucket in self._skeletons.items() for skeleton in bucket]
+        self.store.add_skeletons(items)
+        return self._merge(self.store.skeletons())
+
+    def save(self, path=None):
+        """Atomically write the pool back to its JSON file"""
+        path = path or self.path
+        with self._lock:
+            data = {"version": 1, "skeletons": {k: list(v) for k, v in self._skeletons.items()}}
+            self._dirty = False
+            self._last_save = time.time()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def count(self, relationship, traits, language):
+        with self._lock:
+            return len(self._skeletons.get(combo_key(relationship, traits, language), ()))
+
+    def add(self, relationship, traits, language, skeleton):
+        """Add a skeleton if it has every placeholder; returns True when stored"""
+        skeleton = (skeleton or "").strip()
+        if not is_valid_skeleton(skeleton):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            bucket = self._skeletons.setdefault(combo_key(relationship, traits, language), [])
+            if skeleton in bucket:
+                return False
+            bucket.append(skeleton)
+            self._dirty = True
+        if self.store:
+            self.store.add_skeletons([(combo_key(relationship, traits, language), skeleton)])
+        return True
+
+    def take(self, relationship, traits, language):
+        """Return a random skeleton for the combination, or None"""
+        if not self.enabled:
+            return None
+        key = combo_key(relationship, traits, language)
+        if self.store and not self.count(relationship, traits, language):
+            # Another worker may have topped this combo up since we loaded
+            self._merge(self.store.skeletons(key))
+        with self._lock:
+            bucket = self._skeletons.get(key)
+            if not bucket:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return random.choice(bucket)
+
+    def request_top_up(self, relationship, traits, language):
+        """Queue one background generation if the combination is below target"""
+        if not self.enabled or self.generator is None:
+            return False
+        key = combo_key(relationship, traits, language)
+        with self._lock:
+            if (len(self._skeletons.get(key, ())) >= self.target
+                    or key in self._pending or len(self._pending) >= self.max_pending):
+                return False
+            self._pending.add(key)
+            if self._executor is None:
+                # One worker, and each top-up only takes a slot that is free right away
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="skeleton-top-up")
+        self._executor.submit(self._top_up, key, relationship, list(traits or []), language)
+        return True
+
+    def _top_up(self, key, relationship, traits, language):
+        try:
+            if self.add(relationship, traits, language, self.generator(relationship, traits, language)):
+                self.top_ups += 1
+            if self._dirty and time.time() - self._last_save > self.save_interval:
+                self.save()
+        except QueueFull:
+            # Live traffic has every slot; a later request for this combo tries again
+            with self._lock:
+                self.skipped_busy += 1
+        except Exception as e:
+            debug_log(f"Skeleton top-up failed for {key}: {type(e).__name__} - {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "combos": len(self._skeletons),
+                "skeletons": sum(len(v) for v in self._skeletons.values()),
+                "top_ups": self.top_ups,
+                "rejected": self.rejected,
+                "skipped_busy": self.skipped_busy,
+                "pending": len(self._pending),
+            }
+
+
+skeleton_pool = SkeletonPool.from_env()
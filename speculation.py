@@ -0,0 +1,163 @@
+import os, threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from contextlib import nullcontext
+import metrics
+from async_engine import CancelScope, cancel_scope
+from scheduler import generation_scheduler
+from wish_cache import make_key
+from wish_engine import generate_wish
+from wish_logging import debug_log, log_event, log_context
+
+# Opt-in: start generating once the form is complete, before Generate is clicked
+SPECULATIVE = os.getenv("WISH_SPECULATIVE", "0") == "1"
+SPECULATIVE_WORKERS = int(os.getenv("WISH_SPECULATIVE_WORKERS", "4"))
+
+OUTCOMES = ("started", "hit", "joined", "shared", "cancelled", "wasted", "skipped_busy")
+
+
+class SpeculationCancelled(BaseException):
+    """Stops a discarded speculative generation.
+
+    Raised from the token callback, or by the async engine when the job's
+    cancel scope stops a call that isn't streaming. A BaseException so
+    backend tiers don't treat it as a failure and fall through to the next
+    one; single-flight hands the generation to any real request waiting on it.
+    """
+
+
+class SpeculativeJob:
+    """One background generation for a complete set of form inputs"""
+
+    def __init__(self, speculator, params):
+        self.speculator = speculator
+        self.params = params
+        self.key = speculation_key(params)
+        self.cache_key = make_key(params["relationship"], params["traits"], params["life_thing"], params["language"])
+        self.cancelled = threading.Event()
+        self.scope = CancelScope(SpeculationCancelled)
+        self.skipped = False
+        self.future = None
+
+    def _on_token(self, text):
+        if self.cancelled.is_set():
+            raise SpeculationCancelled()
+
+    def run(self, session_id):
+        """The wish, or None when no generation slot was free to start it"""
+        # Only start on a slot that is free right now, so a real click never queues behind this
+        acquired, token = generation_scheduler.try_acquire()
+        if not acquired:
+            self.skipped = True
+            self.speculator.record("skipped_busy")
+            return None
+        self.speculator.record("started")
+        try:
+            with log_context(session_id=session_id, speculative=True), cancel_scope(self.scope):
+                # Model calls run on the slot held here instead of queueing for another
+                return generate_wish(**self.params, on_token=self._on_token,
+                                     slot=lambda on_position: nullcontext())
+        finally:
+            generation_scheduler.release(token)
+
+    def discard(self, reusable=False):
+        """Drop this job; a running one keeps going when a real request can share it"""
+        if self.future.done():
+            if not self.future.cancelled() and not self.skipped:
+                self.speculator.record("wasted")
+            return
+        if reusable:
+            # Same relationship/traits/passion/language: a click may join this
+            # generation through single-flight and get it with its own names.
+            # Counted apart from hits, since nothing confirms a click used it
+            self.speculator.record("shared")
+            return
+        self.cancelled.set()
+        self.scope.cancel()
+        self.future.cancel()
+        self.speculator.record("cancelled")
+
+
+def speculation_key(params):
+    return (params["sender_name"], params["recipient_name"], params["relationship"],
+            tuple(params["traits"]), params["life_thing"], params["language"])
+
+
+class Speculator:
+    """Runs speculative generations on a small thread pool and counts how they end.
+
+    Jobs only start on a generation slot that is free right now (nobody
+    queued), so speculation never makes a real click wait.
+    """
+
+    def __init__(self, workers=SPECULATIVE_WORKERS):
+        self.counts = dict.fromkeys(OUTCOMES, 0)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="wish-speculate")
+        self._lock = threading.Lock()
+
+    def record(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+        SPECULATIONS.inc(outcome=outcome)
+
+    def update(self, job, params, session_id):
+        """Make sure a job is running for these inputs; returns the job to keep (or None)"""
+        if job and job.key == speculation_key(params) and not job.skipped:
+            return job
+        # Cheap early out; run() does the real admission, including the box-wide slots
+        if generation_scheduler.queue_depth or generation_scheduler.in_flight >= generation_scheduler.max_in_flight:
+            if job:
+                job.discard()
+            self.record("skipped_busy")
+            return None
+        new_job = SpeculativeJob(self, params)
+        if job:
+            job.discard(reusable=job.cache_key == new_job.cache_key)
+        new_job.future = self._executor.submit(new_job.run, session_id)
+        debug_log(f"🔮 Speculating for {new_job.params['relationship']}/{new_job.params['language']}")
+        return new_job
+
+    def claim(self, job, params):
+        """Result of the job for exactly these inputs, waiting if it is still running.
+
+        Returns None when there is no usable job, and the caller generates as usual.
+        """
+        if not job:
+            return None
+        if job.key != speculation_key(params):
+            job.discard(reusable=job.cache_key == make_key(params["relationship"], params["traits"],
+                                                            params["life_thing"], params["language"]))
+            return None
+        outcome = "hit" if job.future.done() else "joined"
+        try:
+            wish = job.future.result()
+        except (CancelledError, SpeculationCancelled):
+            return None
+        except Exception as e:
+            debug_log(f"Speculative generation failed: {type(e).__name__} - {e}")
+            return None
+        if wish is None:
+            return None
+        self.record(outcome)
+        log_event("speculation_claimed", outcome=outcome)
+        return wish
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        used = counts["hit"] + counts["joined"]  # Only jobs a click consumed through claim()
+        counts["hit_rate"] = round(used / counts["started"], 3) if counts["started"] else 0.0
+        counts["waste_rate"] = round(counts["wasted"] / counts["started"], 3) if counts["started"] else 0.0
+        return counts
+
+
+def _collect_speculation_stats():
+    stats = speculator.stats()
+    SPECULATION_RATE.set(stats["hit_rate"], kind="hit")
+    SPECULATION_RATE.set(stats["waste_rate"], kind="waste")
+
+speculator = Speculator()
+
+SPECULATIONS = metrics.counter("wish_speculations_total", "Speculative generations by outcome", ["outcome"])
+SPECULATION_RATE = metrics.gauge("wish_speculation_rate", "Share of speculative generations used (hit) or wasted",
+                                 ["kind"])
+metrics.add_collector(_collect_speculation_stats)
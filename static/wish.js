@@ -0,0 +1,160 @@
+// Diwali Wish Maker page script, loaded once per page by the loader in assets.py.
+// It runs in the top-level document, outside Streamlit's element tree, so nothing
+// here is re-sent or re-mounted when the script reruns. It is also the single
+// client-side controller for step scrolling, copy-to-clipboard and GA events.
+(function () {
+  if (window.wishAssetsLoaded) {
+    return;
+  }
+  window.wishAssetsLoaded = true;
+
+  // Google Analytics (gtag.js)
+  var GA_ID = 'G-0QSZXW3BKD';
+  var tag = document.createElement('script');
+  tag.async = true;
+  tag.src = 'https://www.googletagmanager.com/gtag/js?id=' + GA_ID;
+  document.head.appendChild(tag);
+
+  window.dataLayer = window.dataLayer || [];
+  window.gtag = function () { window.dataLayer.push(arguments); };
+  window.gtag('js', new Date());
+  window.gtag('config', GA_ID);
+
+  // Custom event tracking function
+  window.trackWishGeneration = function (relationship, language) {
+    window.gtag('event', 'generate_wish', {
+      'event_category': 'Wish',
+      'event_label': relationship,
+      'language': language
+    });
+  };
+
+  // Festive decorations (fixed position, so they can live outside the app container)
+  var DECORATIONS = [
+    ['diya-decoration', '🪔', 'top: 10%; left: 5%;'],
+    ['diya-decoration', '🪔', 'top: 20%; right: 8%; animation-delay: 0.5s;'],
+    ['diya-decoration', '🪔', 'top: 60%; left: 3%; animation-delay: 1s;'],
+    ['diya-decoration', '🪔', 'top: 75%; right: 5%; animation-delay: 1.5s;'],
+    ['firecracker', '🎆', 'top: 15%; left: 15%; animation-delay: 0.3s;'],
+    ['firecracker', '✨', 'top: 35%; right: 12%; animation-delay: 0.8s;'],
+    ['firecracker', '🎇', 'top: 50%; left: 10%; animation-delay: 1.2s;'],
+    ['firecracker', '🎆', 'top: 70%; right: 15%; animation-delay: 1.6s;'],
+    ['sparkle-dot', '', 'top: 25%; left: 20%; animation-delay: 0.2s;'],
+    ['sparkle-dot', '', 'top: 45%; right: 18%; animation-delay: 0.6s;'],
+    ['sparkle-dot', '', 'top: 65%; left: 12%; animation-delay: 1s;'],
+    ['sparkle-dot', '', 'top: 80%; right: 20%; animation-delay: 1.4s;'],
+    ['sparkle-dot', '', 'top: 30%; left: 25%; animation-delay: 0.4s;'],
+    ['sparkle-dot', '', 'top: 55%; right: 22%; animation-delay: 0.9s;']
+  ];
+
+  function addDecorations() {
+    if (document.getElementById('wish-decorations')) {
+      return;
+    }
+    var layer = document.createElement('div');
+    layer.id = 'wish-decorations';
+    layer.setAttribute('aria-hidden', 'true');
+    DECORATIONS.forEach(function (d) {
+      var el = document.createElement('div');
+      el.className = d[0];
+      el.textContent = d[1];
+      el.style.cssText = d[2];
+      layer.appendChild(el);
+    });
+    document.body.appendChild(layer);
+  }
+
+  // Page controller: the app emits hidden .wish-cmd markers (scroll, track) and
+  // plain buttons; one observer and one click handler replace per-step iframes
+  var lastCommand = {};
+
+  function runCommand(el) {
+    var data = el.dataset;
+    var key = JSON.stringify(data);
+    // Markers are re-rendered on every rerun; act on each distinct command once
+    if (lastCommand[data.cmd] === key) {
+      return;
+    }
+    lastCommand[data.cmd] = key;
+    if (data.cmd === 'scroll') {
+      setTimeout(function () {
+        var target = document.getElementById(data.target);
+        if (target) {
+          target.scrollIntoView({ behavior: 'smooth', block: 'center' });
+        }
+      }, Number(data.delay || 100));
+    } else if (data.cmd === 'track') {
+      window.trackWishGeneration(data.relationship, data.language);
+    }
+  }
+
+  var scanQueued = false;
+  function scanCommands() {
+    scanQueued = false;
+    document.querySelectorAll('.wish-cmd').forEach(runCommand);
+  }
+  function queueScan() {
+    // Streamlit mutates the DOM in bursts; look for markers once per frame
+    if (!scanQueued) {
+      scanQueued = true;
+      window.requestAnimationFrame(scanCommands);
+    }
+  }
+
+  function copyText(text) {
+    if (navigator.clipboard && window.isSecureContext) {
+      return navigator.clipboard.writeText(text);
+    }
+    return new Promise(function (resolve, reject) {
+      var textArea = document.createElement('textarea');
+      textArea.value = text;
+      textArea.style.position = 'fixed';
+      textArea.style.left = '-999999px';
+      textArea.style.top = '-999999px';
+      document.body.appendChild(textArea);
+      textArea.focus();
+      textArea.select();
+      var copied = false;
+      try {
+        copied = document.execCommand('copy');
+      } catch (err) {
+        copied = false;
+      }
+      document.body.removeChild(textArea);
+      (copied ? resolve : reject)();
+    });
+  }
+
+  function flashLabel(button, label) {
+    var original = button.dataset.label || button.textContent;
+    button.dataset.label = original;
+    button.textContent = label;
+    setTimeout(function () { button.textContent = original; }, 2000);
+  }
+
+  document.addEventListener('click', function (event) {
+    var button = event.target.closest('.wish-copy-btn');
+    if (!button) {
+      return;
+    }
+    copyText(button.dataset.text || '').then(function () {
+      flashLabel(button, '✓ Copied!');
+    }, function () {
+      flashLabel(button, '❌ Failed');
+    });
+  });
+
+  function start() {
+    addDecorations();
+    new MutationObserver(queueScan).observe(document.body, {
+      childList: true, subtree: true, attributes: true, attributeFilter: ['data-target', 'data-id']
+    });
+    scanCommands();
+  }
+
+  if (document.body) {
+    start();
+  } else {
+    document.addEventListener('DOMContentLoaded', start);
+  }
+})();
@@ -0,0 +1,283 @@
+import os, time, shutil, hashlib, tempfile, threading, subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from cards import card_renderer, pick_template, CARD_VERSION
+from wish_logging import debug_log, log_event
+
+# Greeting videos: the card revealed line by line over the background music
+VIDEO_WORKERS = int(os.getenv("WISH_VIDEO_WORKERS", "1"))        # concurrent ffmpeg encodes
+VIDEO_MAX_QUEUE = int(os.getenv("WISH_VIDEO_MAX_QUEUE", "8"))     # waiting jobs; beyond this, refuse
+VIDEO_CACHE_SIZE = int(os.getenv("WISH_VIDEO_CACHE_SIZE", "32"))  # finished videos kept on disk
+VIDEO_THREADS = int(os.getenv("WISH_VIDEO_THREADS", "2"))         # ffmpeg threads per encode
+VIDEO_TIMEOUT = float(os.getenv("WISH_VIDEO_TIMEOUT", "120"))     # encode deadline before ffmpeg is killed
+VIDEO_DIR = os.getenv("WISH_VIDEO_DIR") or os.path.join(tempfile.gettempdir(), "wishmaker-videos")
+FFMPEG = os.getenv("WISH_FFMPEG", "ffmpeg")
+MUSIC_FILE = os.getenv("WISH_VIDEO_MUSIC") or os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            "background_music.mp3")
+VIDEO_VERSION = "1"  # bump when the timeline or encoding changes
+
+# Timeline, in seconds
+TITLE_SECONDS = 1.5
+LINE_SECONDS = 0.7
+HOLD_SECONDS = 4.0
+FPS = 25
+
+
+def video_key(text, template, music=""):
+    return hashlib.sha256(f"{VIDEO_VERSION}|{CARD_VERSION}|{music}|{template}|{text}".encode("utf-8")).hexdigest()
+
+
+class VideoJob:
+    """One greeting video, shared by every session that asks for the same wish"""
+
+    def __init__(self, key, text, template):
+        self.key = key
+        self.text = text
+        self.template = template
+        self.stage = "queued"   # queued, drawing, encoding, done, error
+        self.progress = 0.0
+        self.path = None
+        self.error = ""
+        self.created = time.time()
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def finish(self, path=None, error=""):
+        self.path = path
+        self.error = error
+        self.stage = "error" if error else "done"
+        self.progress = 1.0 if path else self.progress
+        self._done.set()
+
+    def label(self):
+        if self.stage == "queued":
+            return "Waiting for a free video encoder..."
+        if self.stage == "drawing":
+            return "Drawing your card..."
+        return f"Encoding video... {int(self.progress * 100)}%"
+
+    def data(self):
+        """MP4 bytes, or None if the file was evicted since"""
+        try:
+            with open(self.path, "rb") as f:
+                return f.read()
+        except (OSError, TypeError):
+            return None
+
+
+class VideoExporter:
+    """Bounded background queue that turns wishes into MP4 greetings with ffmpeg.
+
+    Frames come from the card render pool and ffmpeg runs as a niced
+    subprocess, so encodes never hold the GIL or a Streamlit script thread.
+    Identical wishes share one job, finished videos are kept on disk by
+    content hash (other workers pointed at the same WISH_VIDEO_DIR reuse
+    them), and the background music is decoded to PCM once per process.
+    """
+
+    def __init__(self, workers=VIDEO_WORKERS, max_queue=VIDEO_MAX_QUEUE, cache_size=VIDEO_CACHE_SIZE,
+                 directory=VIDEO_DIR, ffmpeg=FFMPEG, music=MUSIC_FILE):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.cache_size = cache_size
+        self.directory = directory
+        self.ffmpeg = shutil.which(ffmpeg) or (ffmpeg if os.path.isfile(ffmpeg) else None)
+        self.music = music
+        self.counts = dict.fromkeys(("queued", "reused", "rejected", "done", "error"), 0)
+        self._jobs = OrderedDict()  # key -> VideoJob, oldest first
+        self._pending = 0
+        self._audio = None          # (music signature, decoded WAV path or None)
+        self._lock = threading.Lock()
+        self._audio_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="wish-video")
+
+    @classmethod
+    def from_env(cls):
+        return cls()
+
+    @property
+    def available(self):
+        return self.ffmpeg is not None
+
+    def _record(self, result):
+        self.counts[result] += 1
+        VIDEO_JOBS.inc(result=result)
+
+    def submit(self, text, template=None):
+        """Job for this wish's video, shared with identical requests; None when the queue is full"""
+        template = template or pick_template(text)
+        key = video_key(text, template, self._music_signature())
+        path = os.path.join(self.directory, key + ".mp4")
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.stage != "error" and (not job.done or os.path.exists(job.path)):
+                self._jobs.move_to_end(key)
+                self._record("reused")
+                return job
+            job = VideoJob(key, text, template)
+            if os.path.exists(path):
+                # Encoded before a restart, or by another worker sharing the directory
+                job.finish(path)
+                self._jobs[key] = job
+                self._record("reused")
+                self._trim()
+                return job
+            if self._pending >= self.workers + self.max_queue:
+                self._record("rejected")
+                return None
+            self._pending += 1
+            self._jobs[key] = job
+            self._record("queued")
+            self._trim()
+        self._executor.submit(self._run, job, path)
+        return job
+
+    def _trim(self):
+        """Forget the oldest finished jobs beyond cache_size and delete their files"""
+        while len(self._jobs) > self.cache_size:
+            oldest = next((key for key, job in self._jobs.items() if job.done), None)
+            if oldest is None:
+                return
+            job = self._jobs.pop(oldest)
+            if job.path:
+                try:
+                    os.remove(job.path)
+                except OSError:
+                    pass
+
+    def _run(self, job, path):
+        started = time.time()
+        workdir = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            workdir = tempfile.mkdtemp(prefix="job-", dir=self.directory)
+            job.stage = "drawing"
+            frames = card_renderer.frames(job.text, job.template)
+            job.stage = "encoding"
+            job.progress = 0.05
+            self._encode(job, frames, workdir, path)
+            job.finish(path)
+            self._record("done")
+            VIDEO_SECONDS.observe(time.time() - started)
+            log_event("video_exported", frames=len(frames), seconds=round(time.time() - started, 2),
+                      size_bytes=os.path.getsize(path))
+        except Exception as e:
+            debug_log(f"Video export failed: {type(e).__name__} - {e}")
+            job.finish(error=str(e) or type(e).__name__)
+            self._record("error")
+        finally:
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+            with self._lock:
+                self._pending -= 1
+
+    def _music_signature(self):
+        try:
+            stat = os.stat(self.music)
+            return (stat.st_size, stat.st_mtime)
+        except OSError:
+            return None
+
+    def audio(self):
+        """Background music decoded to a WAV once, or None for a silent track"""
+        signature = self._music_signature()
+        with self._audio_lock:
+            if self._audio is not None and self._audio[0] == signature:
+                return self._audio[1]
+            wav = None
+            if signature and signature[0] > 0:
+                digest = hashlib.sha1(f"{self.music}|{signature}".encode("utf-8")).hexdigest()[:16]
+                wav = os.path.join(self.directory, f"music-{digest}.wav")
+                if not os.path.exists(wav):
+                    os.makedirs(self.directory, exist_ok=True)
+                    partial = f"{wav}.{os.getpid()}.tmp"
+                    result = subprocess.run([self.ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+                                             "-i", self.music, "-ac", "2", "-ar", "44100", "-f", "wav", partial],
+                                            capture_output=True, text=True, timeout=VIDEO_TIMEOUT)
+                    if result.returncode == 0:
+                        os.replace(partial, wav)  # Atomic, so workers sharing the directory never see half a file
+                    else:
+                        debug_log(f"Couldn't decode {self.music}; videos will be silent: {result.stderr.strip()[-200:]}")
+                        wav = None
+                        if os.path.exists(partial):
+                            os.remove(partial)
+            self._audio = (signature, wav)
+            return wav
+
+    def _encode(self, job, frames, workdir, path):
+        # concat demuxer: each frame held for its slot, the last one for the closing hold
+        durations = [TITLE_SECONDS] + [LINE_SECONDS] * (len(frames) - 2) + [HOLD_SECONDS]
+        durations = durations[:len(frames)]
+        total = sum(durations)
+        lines = ["ffconcat version 1.0"]
+        for i, (frame, seconds) in enumerate(zip(frames, durations)):
+            name = f"frame{i:03d}.jpg"
+            with open(os.path.join(workdir, name), "wb") as f:
+                f.write(frame)
+            lines += [f"file '{name}'", f"duration {seconds}"]
+        lines.append(f"file 'frame{len(frames) - 1:03d}.jpg'")  # The last duration only applies if repeated
+        playlist = os.path.join(workdir, "frames.txt")
+        with open(playlist, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+        wav = self.audio()
+        audio_input = ["-stream_loop", "-1", "-i", wav] if wav else ["-f", "lavfi", "-i", "anullsrc=r=44100:cl=stereo"]
+        filters = (f"[0:v]fps={FPS},fade=t=in:d=0.5,fade=t=out:st={total - 0.8:.2f}:d=0.8,format=yuv420p[v];"
+                   f"[1:a]afade=t=in:d=1,afade=t=out:st={total - 1.5:.2f}:d=1.5[a]")
+        partial = os.path.join(workdir, "out.mp4")
+        command = [self.ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+                   "-progress", "pipe:1", "-nostats",
+                   "-f", "concat", "-safe", "0", "-i", playlist, *audio_input,
+                   "-filter_complex", filters, "-map", "[v]", "-map", "[a]", "-t", f"{total:.2f}",
+                   "-c:v", "libx264", "-preset", "veryfast", "-tune", "stillimage", "-crf", "23",
+                   "-c:a", "aac", "-b:a", "128k", "-threads", str(VIDEO_THREADS), "-movflags", "+faststart",
+                   partial]
+        if shutil.which("nice"):
+            command = ["nice", "-n", "10"] + command  # Interactive work always comes first
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        timer = threading.Timer(VIDEO_TIMEOUT, process.kill)
+        timer.start()
+        try:
+            # -progress writes key=value blocks; out_time_us is the encoded position
+            for line in process.stdout:
+                key, _, value = line.strip().partition("=")
+                if key in ("out_time_us", "out_time_ms") and value.isdigit():
+                    job.progress = max(job.progress, min(0.99, 0.05 + 0.95 * int(value) / 1e6 / total))
+            error = process.stderr.read()
+            process.wait()
+        finally:
+            timer.cancel()
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with {process.returncode}: {error.strip()[-300:]}")
+        os.replace(partial, path)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+            counts = dict(self.counts)
+        counts["queued_now"] = sum(1 for job in jobs if job.stage == "queued")
+        counts["running"] = sum(1 for job in jobs if job.stage in ("drawing", "encoding"))
+        counts["stored"] = sum(1 for job in jobs if job.stage == "done")
+        return counts
+
+
+def _collect_video_stats():
+    stats = video_exporter.stats()
+    VIDEO_QUEUE.set(stats["queued_now"], state="queued")
+    VIDEO_QUEUE.set(stats["running"], state="running")
+    VIDEO_QUEUE.set(stats["stored"], state="stored")
+
+video_exporter = VideoExporter.from_env()
+
+VIDEO_JOBS = metrics.counter("wish_video_jobs_total", "Greeting video requests by result", ["result"])
+VIDEO_SECONDS = metrics.histogram("wish_video_export_seconds", "Greeting video time from start to MP4",
+                                  buckets=(1, 2, 5, 10, 20, 40, 80))
+VIDEO_QUEUE = metrics.gauge("wish_video_jobs", "Greeting video jobs by state", ["state"])
+metrics.add_collector(_collect_video_stats)
@@ -0,0 +1,167 @@
+import os, re, time, random, threading
+from collections import OrderedDict
+from wish_store import wish_store, STORE_WARM_KEYS
+
+# Placeholders used to store wishes without the requester's names, so one
+# generated wish can be reused for everyone with the same prompt inputs
+SENDER_TOKEN = "<<SENDER>>"
+RECIPIENT_TOKEN = "<<RECIPIENT>>"
+
+
+def make_key(relationship, traits, life_thing, language):
+    """Normalize the name-independent prompt inputs into a cache key"""
+    traits_key = ",".join(sorted(t.strip().lower() for t in (traits or [])))
+    life_key = " ".join((life_thing or "").lower().split())
+    return f"{(relationship or '').lower()}|{traits_key}|{life_key}|{(language or 'English').lower()}"
+
+
+def _name_pattern(name):
+    return re.compile(r"(?<!\w)" + re.escape(name.strip()) + r"(?!\w)")
+
+
+def templatize(wish, sender_name, recipient_name):
+    """Replace the names in a generated wish with placeholders.
+
+    Returns None when the wish can't be safely shared: if either name is
+    missing from the text (e.g. transliterated to Devanagari) it would leak
+    into other users' wishes.
+    """
+    sender, recipient = (sender_name or "").strip(), (recipient_name or "").strip()
+    if len(sender) < 2 or len(recipient) < 2 or sender.lower() == recipient.lower():
+        return None
+    sender_re, recipient_re = _name_pattern(sender), _name_pattern(recipient)
+    if not sender_re.search(wish) or not recipient_re.search(wish):
+        return None
+    # Replace the longer name first so "Raj" doesn't eat into "Raj Kumar"
+    pairs = sorted([(sender_re, SENDER_TOKEN, sender), (recipient_re, RECIPIENT_TOKEN, recipient)],
+                   key=lambda p: len(p[2]), reverse=True)
+    for pattern, token, _ in pairs:
+        wish = pattern.sub(token, wish)
+    return wish
+
+
+def personalize(template, sender_name, recipient_name):
+    """Fill a templatized wish back in with the requester's names"""
+    return template.replace(SENDER_TOKEN, sender_name).replace(RECIPIENT_TOKEN, recipient_name)
+
+
+class WishCache:
+    """Bounded LRU/TTL cache holding several wish variants per key.
+
+    With a store, every variant is also written to disk and misses are
+    looked up there, so workers share what the others generated and a
+    restarted process comes back warm.
+    """
+
+    def __init__(self, max_size=1024, ttl=6 * 3600, variants=3, store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.variants = variants
+        self.store = store if store is not None and store.enabled else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (created_at, [templates])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        cache = cls(
+            max_size=int(os.getenv("WISH_CACHE_MAX_SIZE", "1024")),
+            ttl=float(os.getenv("WISH_CACHE_TTL", str(6 * 3600))),
+            variants=max(1, int(os.getenv("WISH_CACHE_VARIANTS", "3"))),
+            store=wish_store,
+        )
+        if cache.enabled and cache.store:
+            cache.warm(STORE_WARM_KEYS)
+            cache.store.start_compactor(cache.ttl)
+        return cache
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def warm(self, limit):
+        """Load the most recently stored keys into memory; returns how many were loaded"""
+        entries = self.store.recent_cache(min(limit, self.max_size), self.ttl)
+        with self._lock:
+            for key, (created_at, templates) in entries.items():
+                self._entries[key] = (created_at, templates[:self.variants])
+            self._trim()
+        return len(entries)
+
+    def _trim(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry and self.ttl and time.time() - entry[0] > self.ttl:
+            del self._entries[key]
+            self.evictions += 1
+            entry = None
+        return entry
+
+    def get(self, key):
+        """Return a random variant for key, or None on a miss.
+
+        Keys only count as hits once all variants have been collected, so
+        the model keeps filling in variety for the first few requests.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._fresh(key)
+            found = len(entry[1]) if entry else 0
+        if found < self.variants and self.store:
+            # Another worker (or this one before a restart) may have collected more
+            created_at, templates = self.store.cache_variants(key, self.ttl)
+            if len(templates) > found:
+                with self._lock:
+                    self._entries[key] = (created_at, templates[:self.variants])
+                    self._trim()
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry or len(entry[1]) < self.variants:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return random.choice(entry[1])
+
+    def add(self, key, template):
+        """Store a templatized wish as another variant for key"""
+        if not self.enabled or not template:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl and time.time() - entry[0] > self.ttl):
+                entry = (time.time(), [])
+                self._entries[key] = entry
+            added = template not in entry[1] and len(entry[1]) < self.variants
+            if added:
+                entry[1].append(template)
+            self._entries.move_to_end(key)
+            self._trim()
+        if added and self.store:
+            self.store.add_cache(key, template)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters for measuring how much model load the cache saves"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+wish_cache = WishCache.from_env()
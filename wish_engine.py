@@ -0,0 +1,327 @@
+import time, random, httpx
+import metrics
+from http_pool import pool_stats
+from wish_cache import wish_cache, make_key, templatize, personalize
+from wish_store import wish_store
+from scheduler import generation_scheduler, QueueFull
+from singleflight import wish_flights
+from skeletons import skeleton_pool, fill_skeleton, SENDER_TOKEN, RECIPIENT_TOKEN, PASSION_TOKEN
+from wish_logging import debug_log, log_event, log_context, current_context, new_request_id, log_stats
+from circuit_breaker import CircuitOpenError
+from backends import (get_backends, get_backend, all_backends, BackendUnavailable,
+                      OllamaRouter, HedgedBackend, OLLAMA_HOSTS, OLLAMA_MODEL)
+
+# Closed option sets offered by the form
+RELATIONSHIPS = ["Friend", "Family", "Colleague", "Lover", "Mentor"]
+TRAITS = ["Creative", "Funny", "Caring", "Ambitious", "Calm", "Energetic",
+          "Thoughtful", "Kind", "Smart", "Cheerful"]
+LANGUAGES = ["English", "Hindi", "Hinglish"]
+
+# Promotional taglines for wishkarle.online
+PROMO_TAGLINES = [
+    "🪔 Dil se likha, AI ne roshan kar diya ✨",
+    "🎆 Mere emotions, AI ka expression 💫",
+    "✨ Khayaal mera, andaaz AI ka 😄",
+    "💫 Thoda pyaar mera, thoda magic AI ka 🪔",
+    "🌟 Main socha, AI ne likh diya 😉",
+    "🎇 Mera jazbaat, AI ka likha hua andaaz ✨",
+    "🪔 Dil se socha, AI ne diya roop 💛",
+    "🌈 Pyar mera, presentation AI ka 🎁",
+    "💥 Emotion mera, expression AI ka ✨",
+    "🎊 Feeling human wali, likhawat AI wali 😄",
+    "🪔 Soch meri, likhavat AI ki 💫",
+    "🌸 Dil ke jazbaat, AI ke alfaaz 🪔",
+    "✨ Mujhse likha gaya, AI se nikha gaya 🎇",
+    "💫 Mere shabd, AI ka touch ✨",
+    "🎆 Mann se bana, AI se sajaa diya 🪔"
+]
+
+# Language-specific strict instructions (anti-hallucination)
+LANG_INSTRUCTIONS = {
+    "English": "MUST write in ENGLISH only.",
+    "Hindi": "MUST write in pure HINDI (हिंदी) Devanagari script. NOT Punjabi. NOT Urdu. Use: दिवाली, शुभकामनाएं, खुशियाँ, प्रकाश, जीवन.",
+    "Hinglish": "MUST write in HINGLISH (Hindi+English mixed). Example: 'Aapko Diwali ki shubhkamnayein' NOT pure Hindi/English."
+}
+
+def add_promo_tagline(wish_text):
+    """Add a random promotional tagline to the wish"""
+    tagline = random.choice(PROMO_TAGLINES)
+    return f"{wish_text}\n\n{tagline}\n(wishkarle.online)"
+
+def format_traits(traits):
+    return ", ".join(traits) if traits else "wonderful"
+
+def build_prompt(sender_name, recipient_name, relationship, traits, life_thing, language):
+    """Build the wish prompt sent to the model"""
+    traits_str = format_traits(traits)
+    return f"""Write a Diwali wish in {language}.
+
+LANGUAGE RULE: {LANG_INSTRUCTIONS.get(language, LANG_INSTRUCTIONS['English'])}
+
+GIVEN INFORMATION (USE ONLY THIS):
+- From: {sender_name}
+- To: {recipient_name}
+- Relationship: {relationship}
+- Their traits: {traits_str}
+- Their passion: {life_thing}
+
+STRICT RULES:
+1. Use ONLY the information provided above
+2. Write in {language} language only
+3. Length: 2-4 sentences maximum
+4. Include 6-8 Diwali emojis (🪔✨🎆💫🌟🎇)
+5. Address {recipient_name} by name
+6. Mention their {traits_str} traits
+7. Reference their {life_thing} passion
+8. End with wishes from {sender_name}
+
+FORMAT: Short greeting + personal line + wish + signature
+
+DO NOT invent facts. DO NOT add information not provided. Output ONLY the wish text."""
+
+def build_skeleton_prompt(relationship, traits, language):
+    """Build the prompt for a reusable wish skeleton with name/passion placeholders"""
+    traits_str = format_traits(traits)
+    return f"""Write a Diwali wish TEMPLATE in {language}.
+
+LANGUAGE RULE: {LANG_INSTRUCTIONS.get(language, LANG_INSTRUCTIONS['English'])}
+
+GIVEN INFORMATION (USE ONLY THIS):
+- Relationship: {relationship}
+- Their traits: {traits_str}
+
+PLACEHOLDERS (copy them EXACTLY, in Latin letters, including the angle brackets):
+- {RECIPIENT_TOKEN} = the recipient's name
+- {SENDER_TOKEN} = the sender's name
+- {PASSION_TOKEN} = the recipient's passion
+
+STRICT RULES:
+1. Write in {language} language only
+2. Length: 2-4 sentences maximum
+3. Include 6-8 Diwali emojis (🪔✨🎆💫🌟🎇)
+4. Address {RECIPIENT_TOKEN} by name
+5. Mention their {traits_str} traits
+6. Reference their {PASSION_TOKEN} passion
+7. End with wishes from {SENDER_TOKEN}
+
+FORMAT: Short greeting + personal line + wish + signature
+
+DO NOT invent names or facts. Output ONLY the wish template."""
+
+def generate_skeleton(relationship, traits, language):
+    """Generate one wish skeleton through Ollama"""
+    backend = get_backend("ollama")
+    if backend is None:
+        raise BackendUnavailable("no Ollama backend configured in WISH_BACKENDS")
+    return backend.generate(build_skeleton_prompt(relationship, traits, language))
+
+def top_up_skeleton(relationship, traits, language):
+    """Background skeleton generation; only runs on a slot that is free right now, so users never wait on it"""
+    acquired, token = generation_scheduler.try_acquire()
+    if not acquired:
+        raise QueueFull("no free generation slot for a skeleton top-up")
+    try:
+        return generate_skeleton(relationship, traits, language)
+    finally:
+        generation_scheduler.release(token)
+
+# Live Ollama tops up the skeleton pool in the background
+skeleton_pool.generator = top_up_skeleton
+
+def fallback_wish(sender_name, recipient_name, traits, life_thing):
+    """Static template used when no model is reachable"""
+    return f"""Dear {recipient_name} 🪔✨
+
+This Diwali, may your life be filled with endless joy, prosperity, and beautiful moments! 🌟🎆
+Your {format_traits(traits)} spirit lights up every room, just like these diyas! 🕯️💫
+May your passion for {life_thing} grow brighter than ever! 🌈🎉
+
+Happy Diwali! 🪔✨
+With love, {sender_name} ❤️"""
+
+def describe_error(e):
+    if isinstance(e, CircuitOpenError):
+        return f"Skipped: {str(e)}"
+    if isinstance(e, httpx.TimeoutException):
+        return f"Timeout error: {str(e)}"
+    if isinstance(e, httpx.TransportError):
+        return f"Connection error: {str(e)}"
+    return f"Unexpected error: {type(e).__name__} - {str(e)}"
+
+BACKEND_LATENCY = metrics.histogram("wish_backend_request_seconds", "Successful model call latency per backend tier", ["backend"])
+BACKEND_ERRORS = metrics.counter("wish_backend_errors_total", "Failed model calls by backend and error type", ["backend", "type"])
+
+def run_backends(prompt, on_token=None, on_queue_position=None, on_fallback=None, slot=None):
+    """Try each configured backend tier in order.
+
+    Returns (text, backend), or (None, None) when every tier failed.
+    QueueFull propagates so overloaded callers can shed load.
+    """
+    for backend in get_backends():
+        try:
+            debug_log(f"Attempting {backend.name}", backend=backend.name)
+            if backend.scheduled:
+                # Wait for a slot so the local model isn't overloaded
+                with (slot or generation_scheduler.slot)(on_queue_position):
+                    called = time.time()
+                    text = backend.generate(prompt, on_token=on_token)
+            else:
+                called = time.time()
+                text = backend.generate(prompt, on_token=on_token)
+            elapsed = time.time() - called
+            BACKEND_LATENCY.observe(elapsed, backend=backend.name)
+            log_event("backend_success", backend=backend.name, latency_ms=round(elapsed * 1000), **pool_stats())
+            return text, backend
+        except QueueFull:
+            raise
+        except Exception as e:
+            BACKEND_ERRORS.inc(backend=backend.name, type=type(e).__name__)
+            error = describe_error(e)
+            log_event("backend_failed", level="warning", backend=backend.name, error=error)
+            if on_fallback:
+                on_fallback(backend.name, error)
+    return None, None
+
+def generate_wish(sender_name, recipient_name, relationship, traits, life_thing, language,
+                  on_fallback=None, on_token=None, on_queue_position=None, on_served=None, slot=None):
+    """Generate wish text using the cache, skeleton pool, Ollama or OpenAI
+
+    on_token(text_so_far) receives partial Ollama output while it streams.
+    on_queue_position(n) reports the place in the generation queue (0 = started).
+    on_fallback(backend, error) is called for each backend tier that fails.
+    on_served(source) reports where the wish came from ("cache", "skeleton", a
+    backend name, or "shed"/"fallback" for the static template).
+    slot(on_position) is the context manager local model calls run under;
+    defaults to generation_scheduler.slot. Callers already holding a slot
+    pass one that doesn't take another.
+    """
+    # Every log record for this wish carries the same request id
+    with log_context(request_id=current_context().get("request_id") or new_request_id()):
+        return _generate_wish(sender_name, recipient_name, relationship, traits, life_thing, language,
+                              on_fallback, on_token, on_queue_position, on_served, slot)
+
+def _generate_wish(sender_name, recipient_name, relationship, traits, life_thing, language,
+                   on_fallback, on_token, on_queue_position, on_served, slot):
+    started = time.time()
+
+    def served(wish, source):
+        elapsed = time.time() - started
+        WISH_LATENCY.observe(elapsed, source=source)
+        log_event("wish_served", source=source, language=language, latency_ms=round(elapsed * 1000))
+        if on_served:
+            on_served(source)
+        return add_promo_tagline(wish)
+
+    # Serve repeat inputs from the cache without touching the model
+    cache_key = make_key(relationship, traits, life_thing, language)
+    cached = wish_cache.get(cache_key)
+    if cached:
+        debug_log(f"✓ Wish cache hit {wish_cache.stats()}")
+        return served(personalize(cached, sender_name, recipient_name), "cache")
+
+    # Fast path: fill a pregenerated skeleton, topping the pool up in the background
+    skeleton = skeleton_pool.take(relationship, traits, language)
+    skeleton_pool.request_top_up(relationship, traits, language)
+    if skeleton:
+        debug_log(f"✓ Skeleton hit {skeleton_pool.stats()}")
+        return served(fill_skeleton(skeleton, sender_name, recipient_name, life_thing), "skeleton")
+
+    prompt = build_prompt(sender_name, recipient_name, relationship, traits, life_thing, language)
+
+    def run_live():
+        wish, backend = run_backends(prompt, on_token, on_queue_position, on_fallback, slot)
+        if not wish:
+            return None, None, None
+        return wish, templatize(wish, sender_name, recipient_name), backend.name
+
+    # Identical in-flight requests share one generation
+    try:
+        (wish, template, source), shared = wish_flights.do(cache_key, run_live)
+        if shared and wish:
+            if template:
+                debug_log(f"✓ Shared in-flight generation {wish_flights.stats()}")
+                wish, source = personalize(template, sender_name, recipient_name), "shared"
+            else:
+                # The leader's names couldn't be swapped out, so generate our own
+                wish, template, source = run_live()
+        if wish:
+            wish_cache.add(cache_key, template)
+            return served(wish, source)
+    except QueueFull as e:
+        # Overloaded: shed straight to the template so tail latency stays bounded
+        debug_log(f"⚡ Shedding load ({e}) {generation_scheduler.stats()}")
+        return served(fallback_wish(sender_name, recipient_name, traits, life_thing), "shed")
+
+    # Final fallback
+    return served(fallback_wish(sender_name, recipient_name, traits, life_thing), "fallback")
+
+
+def _collect_component_stats():
+    """Mirror component counters and levels into metrics at scrape time"""
+    cache = wish_cache.stats()
+    CACHE_LOOKUPS.set(cache["hits"], result="hit")
+    CACHE_LOOKUPS.set(cache["misses"], result="miss")
+    CACHE_SIZE.set(cache["size"])
+    CACHE_HIT_RATIO.set(cache["hit_ratio"])
+    skeletons = skeleton_pool.stats()
+    SKELETON_LOOKUPS.set(skeletons["hits"], result="hit")
+    SKELETON_LOOKUPS.set(skeletons["misses"], result="miss")
+    SKELETON_COUNT.set(skeletons["skeletons"])
+    scheduler = generation_scheduler.stats()
+    QUEUE_DEPTH.set(scheduler["queue_depth"])
+    IN_FLIGHT.set(scheduler["in_flight"])
+    if "shared_in_flight" in scheduler:
+        SHARED_IN_FLIGHT.set(scheduler["shared_in_flight"])
+    for outcome in ("admitted", "shed", "timed_out"):
+        ADMISSIONS.set(scheduler[outcome], outcome=outcome)
+    COALESCED.set(wish_flights.stats()["coalesced"])
+    pool = pool_stats()
+    HTTP_CONNECTIONS.set(pool["connections_opened"], kind="opened")
+    HTTP_CONNECTIONS.set(pool["reused"], kind="reused")
+    for tier in get_backends():
+        if isinstance(tier, HedgedBackend):
+            hedge = tier.stats()
+            for stat in ("requests", "hedged", "secondary_wins", "fallbacks", "skipped_no_slot"):
+                HEDGES.set(hedge[stat], stat=stat)
+            HEDGE_BUDGET.set(hedge["budget"])
+    for backend in all_backends():
+        if isinstance(backend, OllamaRouter):
+            for host, host_stats in backend.stats().items():
+                BREAKER_OPEN.set(int(host_stats["state"] != "closed"), backend=f"ollama@{host}")
+                if host_stats["ewma_latency"] is not None:
+                    HOST_EWMA.set(host_stats["ewma_latency"], backend=f"ollama@{host}")
+        elif getattr(backend, "breaker", None):
+            BREAKER_OPEN.set(int(backend.breaker.state != "closed"), backend=backend.name)
+    logs = log_stats()
+    for stat in ("written", "dropped", "sampled_out"):
+        LOG_RECORDS.set(logs[stat], stat=stat)
+    LOG_QUEUE.set(logs["queued"])
+    if wish_store.enabled:
+        store = wish_store.stats()
+        STORE_BYTES.set(store["size_bytes"])
+        STORE_ROWS.set(store["cache_rows"], table="cache")
+        STORE_ROWS.set(store["skeletons"], table="skeletons")
+        STORE_ERRORS.set(store["errors"])
+
+WISH_LATENCY = metrics.histogram("wish_generation_seconds", "End-to-end wish latency by serving path", ["source"])
+CACHE_LOOKUPS = metrics.counter("wish_cache_lookups_total", "Wish cache lookups", ["result"])
+CACHE_SIZE = metrics.gauge("wish_cache_keys", "Keys held in the wish cache")
+CACHE_HIT_RATIO = metrics.gauge("wish_cache_hit_ratio", "Wish cache hit ratio since start")
+SKELETON_LOOKUPS = metrics.counter("wish_skeleton_lookups_total", "Skeleton pool lookups", ["result"])
+SKELETON_COUNT = metrics.gauge("wish_skeletons", "Skeletons held in the pool")
+QUEUE_DEPTH = metrics.gauge("wish_queue_depth", "Requests waiting for a generation slot")
+IN_FLIGHT = metrics.gauge("wish_in_flight", "Generations holding a scheduler slot")
+SHARED_IN_FLIGHT = metrics.gauge("wish_shared_in_flight", "Box-wide slots held by all workers (multi-worker mode)")
+ADMISSIONS = metrics.counter("wish_admissions_total", "Scheduler admission outcomes", ["outcome"])
+COALESCED = metrics.counter("wish_coalesced_requests_total", "Requests that shared an in-flight generation")
+HTTP_CONNECTIONS = metrics.counter("wish_http_connections_total", "Model HTTP connections opened vs reused", ["kind"])
+BREAKER_OPEN = metrics.gauge("wish_circuit_open", "1 while a backend's circuit is open or half-open", ["backend"])
+HOST_EWMA = metrics.gauge("wish_backend_ewma_seconds", "EWMA generation latency per Ollama host", ["backend"])
+HEDGES = metrics.counter("wish_hedge_requests_total", "Hedging tier requests, hedges, wins, fallbacks and skips", ["stat"])
+HEDGE_BUDGET = metrics.gauge("wish_hedge_budget_seconds", "Current wait before a hedge is sent")
+LOG_RECORDS = metrics.counter("wish_log_records_total", "Structured log records written, dropped or sampled out", ["stat"])
+LOG_QUEUE = metrics.gauge("wish_log_queue", "Structured log records waiting for the writer")
+STORE_BYTES = metrics.gauge("wish_store_bytes", "Size of the shared SQLite store including its WAL")
+STORE_ROWS = metrics.gauge("wish_store_rows", "Rows in the shared store", ["table"])
+STORE_ERRORS = metrics.counter("wish_store_errors_total", "Store operations that failed and fell back to memory")
+metrics.add_collector(_collect_component_stats)
@@ -0,0 +1,171 @@
+import os, sys, json, time, uuid, queue, random, atexit, threading, contextvars
+from contextlib import contextmanager
+
+# Structured logging settings
+LOG_LEVEL = os.getenv("WISH_LOG_LEVEL", "debug").lower()
+LOG_FORMAT = os.getenv("WISH_LOG_FORMAT", "json").lower()    # json or text
+LOG_QUEUE_SIZE = int(os.getenv("WISH_LOG_QUEUE_SIZE", "10000"))
+LOG_DEBUG_SAMPLE = float(os.getenv("WISH_LOG_DEBUG_SAMPLE", "1.0"))  # fraction of debug records kept
+LOG_RATE_LIMIT = float(os.getenv("WISH_LOG_RATE_LIMIT", "20"))  # debug records/sec per call site, 0 = unlimited
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+_min_level = LEVELS.get(LOG_LEVEL, 10)
+
+# request_id, session_id, ... for the wish currently being served
+_context = contextvars.ContextVar("wish_log_context", default={})
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach fields (request_id, session_id, ...) to every record logged inside the block"""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def current_context():
+    return _context.get()
+
+
+class _RateLimiter:
+    """Token bucket per call site; suppressed counts ride along on the next record"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Returns (allowed, suppressed_since_last_allowed)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, suppressed = self._buckets.get(key, (self.rate, now, 0))
+            tokens = min(self.rate, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+                return False, 0
+            self._buckets[key] = (tokens - 1, now, 0)
+            return True, suppressed
+
+
+class LogWriter:
+    """Bounded queue drained by a background thread, so callers never block on stderr.
+
+    When the queue is full (journald stalled, disk busy) records are dropped
+    and counted rather than slowing down the request that logged them.
+    """
+
+    def __init__(self, stream=None, max_queue=LOG_QUEUE_SIZE, fmt=LOG_FORMAT):
+        self.stream = stream
+        self.fmt = fmt
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._drain, name="wish-log-writer", daemon=True)
+                self._thread.start()
+        return self
+
+    def put(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def format(self, record):
+        if self.fmt == "text":
+            extra = " ".join(f"{k}={v}" for k, v in record.items() if k not in ("ts", "level", "event", "msg"))
+            return f"[{record['level'].upper()}] {record.get('msg') or record['event']}" + (f" ({extra})" if extra else "")
+        return json.dumps(record, ensure_ascii=False, default=str)
+
+    def _write(self, record):
+        try:
+            stream = self.stream or sys.stderr
+            stream.write(self.format(record) + "\n")
+            if self._queue.empty():
+                stream.flush()
+            self.written += 1
+        except Exception:
+            self.dropped += 1
+
+    def _drain(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self._write(record)
+
+    def flush(self):
+        """Write out whatever is still queued (called at interpreter exit)"""
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not None:
+                self._write(record)
+        try:
+            (self.stream or sys.stderr).flush()
+        except Exception:
+            pass
+
+    def stats(self):
+        return {"written": self.written, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+
+_writer = LogWriter().start()
+_limiter = _RateLimiter(LOG_RATE_LIMIT)
+_sampled_out = [0]
+atexit.register(_writer.flush)
+
+
+def log_event(event, level="info", msg=None, _depth=1, **fields):
+    """Queue a structured record; cheap enough to call on the request path.
+
+    Debug records are sampled (WISH_LOG_DEBUG_SAMPLE) and rate limited per
+    call site (WISH_LOG_RATE_LIMIT) so noisy loops can't flood the journal.
+    """
+    severity = LEVELS.get(level, 20)
+    if severity < _min_level:
+        return
+    suppressed = 0
+    if severity <= LEVELS["debug"]:
+        if LOG_DEBUG_SAMPLE < 1.0 and random.random() >= LOG_DEBUG_SAMPLE:
+            _sampled_out[0] += 1
+            return
+        if LOG_RATE_LIMIT > 0:
+            caller = sys._getframe(_depth)
+            allowed, suppressed = _limiter.allow((caller.f_code.co_filename, caller.f_lineno))
+            if not allowed:
+                return
+    record = {"ts": round(time.time(), 3), "level": level, "event": event}
+    if msg is not None:
+        record["msg"] = msg
+    record.update(_context.get())
+    record.update(fields)
+    if suppressed:
+        record["suppressed"] = suppressed
+    _writer.put(record)
+
+
+def debug_log(message, **fields):
+    """Queue a debug record for stderr so it appears in journalctl"""
+    log_event("debug", level="debug", msg=message, _depth=2, **fields)
+
+
+def log_stats():
+    """Writer and filtering counters for the metrics endpoint"""
+    stats = _writer.stats()
+    stats["sampled_out"] = _sampled_out[0]
+    return stats
@@ -0,0 +1,201 @@
+import os, time, sqlite3, threading
+from wish_logging import debug_log, log_event
+
+# Disk-backed store shared by every worker on the box; empty path = memory only
+STORE_PATH = os.getenv("WISH_STORE_PATH", "")
+STORE_MAX_KEYS = int(os.getenv("WISH_STORE_MAX_KEYS", "50000"))     # cache keys kept on disk
+STORE_MAX_MB = float(os.getenv("WISH_STORE_MAX_MB", "64"))           # database size cap
+STORE_COMPACT_INTERVAL = float(os.getenv("WISH_STORE_COMPACT_INTERVAL", "600"))
+STORE_WARM_KEYS = int(os.getenv("WISH_STORE_WARM_KEYS", "1024"))     # cache keys loaded at startup
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT NOT NULL,
+    template TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (key, template)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_created ON cache (created_at);
+CREATE TABLE IF NOT EXISTS skeletons (
+    combo TEXT NOT NULL,
+    skeleton TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (combo, skeleton)
+) WITHOUT ROWID;
+"""
+
+
+class WishStore:
+    """SQLite store for cache templates and skeletons that survives restarts.
+
+    WAL mode lets every worker process read while one writes, so all workers
+    on a box share one warm cache. Each thread uses its own connection with a
+    busy timeout. Only templatized wishes (names replaced by placeholders) are
+    stored, never a user's personalized text. Any SQLite error is logged and
+    treated as a miss, so a broken disk degrades to the in-memory cache.
+    """
+
+    def __init__(self, path, max_keys=STORE_MAX_KEYS, max_mb=STORE_MAX_MB, compact_interval=STORE_COMPACT_INTERVAL):
+        self.path = path
+        self.max_keys = max_keys
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.compact_interval = compact_interval
+        self.errors = 0
+        self.compactions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._compactor = None
+        self._ready = False
+
+    @classmethod
+    def from_env(cls):
+        return cls(STORE_PATH)
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; safe with WAL
+            with self._lock:
+                if not self._ready:
+                    # auto_vacuum only takes effect if set before the first table exists
+                    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(SCHEMA)
+                    self._ready = True
+            self._local.conn = conn
+        return conn
+
+    def _run(self, what, fn, default=None):
+        if not self.enabled:
+            return default
+        try:
+            return fn(self._connect())
+        except sqlite3.Error as e:
+            self.errors += 1
+            debug_log(f"Wish store {what} failed: {type(e).__name__} - {e}")
+            return default
+
+    def cache_variants(self, key, ttl=0):
+        """(oldest created_at, [templates]) stored for key, ignoring expired rows"""
+        since = time.time() - ttl if ttl else 0
+
+        def query(conn):
+            rows = conn.execute("SELECT created_at, template FROM cache WHERE key = ? AND created_at > ? "
+                                "ORDER BY created_at", (key, since)).fetchall()
+            return (rows[0][0], [t for _, t in rows]) if rows else (0, [])
+        return self._run("read", query, (0, []))
+
+    def recent_cache(self, limit=STORE_WARM_KEYS, ttl=0):
+        """Newest keys with their templates, for warm-starting the in-memory cache (oldest first)"""
+        since = time.time() - ttl if ttl else 0
+
+        def query(conn):
+            rows = conn.execute(
+                "SELECT key, created_at, template FROM cache WHERE key IN ("
+                "  SELECT key FROM cache WHERE created_at > ? GROUP BY key ORDER BY MAX(created_at) DESC LIMIT ?"
+                ") AND created_at > ? ORDER BY created_at", (since, limit, since)).fetchall()
+            entries = {}
+            for key, created_at, template in rows:
+                entries.setdefault(key, (created_at, []))[1].append(template)
+            return entries
+        return self._run("warm start", query, {})
+
+    def add_cache(self, key, template):
+        self._run("write", lambda conn: conn.execute(
+            "INSERT OR IGNORE INTO cache (key, template, created_at) VALUES (?, ?, ?)", (key, template, time.time())))
+
+    def skeletons(self, combo=None):
+        """{combo: [skeletons]}, for one combo or all of them"""
+        def query(conn):
+            if combo is None:
+                rows = conn.execute("SELECT combo, skeleton FROM skeletons ORDER BY created_at").fetchall()
+            else:
+                rows = conn.execute("SELECT combo, skeleton FROM skeletons WHERE combo = ? ORDER BY created_at",
+                                    (combo,)).fetchall()
+            result = {}
+            for key, skeleton in rows:
+                result.setdefault(key, []).append(skeleton)
+            return result
+        return self._run("read", query, {})
+
+    def add_skeletons(self, items):
+        """Store (combo, skeleton) pairs in one transaction"""
+        now = time.time()
+
+        def write(conn):
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany("INSERT OR IGNORE INTO skeletons (combo, skeleton, created_at) VALUES (?, ?, ?)",
+                                 [(combo, skeleton, now) for combo, skeleton in items])
+        self._run("write", write)
+
+    def size_bytes(self):
+        return sum(os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p))
+
+    def compact(self, ttl=0):
+        """Drop expired and excess cache keys, then return the freed pages to the filesystem.
+
+        Returns the number of cache rows deleted. Skeletons are bounded by
+        the number of combos and are never compacted.
+        """
+        def run(conn):
+            deleted = 0
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")  # One worker compacts at a time; others wait on busy_timeout
+                if ttl:
+                    deleted += conn.execute("DELETE FROM cache WHERE created_at <= ?", (time.time() - ttl,)).rowcount
+                deleted += conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache GROUP BY key "
+                    "ORDER BY MAX(created_at) DESC LIMIT -1 OFFSET ?)", (self.max_keys,)).rowcount
+                page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+                used = (conn.execute("PRAGMA page_count").fetchone()[0]
+                        - conn.execute("PRAGMA freelist_count").fetchone()[0]) * page_size
+                if used > self.max_bytes:
+                    # Over the size cap: drop the oldest quarter of the cache
+                    deleted += conn.execute(
+                        "DELETE FROM cache WHERE created_at <= (SELECT created_at FROM cache ORDER BY created_at "
+                        "LIMIT 1 OFFSET (SELECT COUNT(*) / 4 FROM cache))").rowcount
+            conn.execute("PRAGMA incremental_vacuum")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return deleted
+        deleted = self._run("compaction", run, 0)
+        self.compactions += 1
+        if deleted:
+            log_event("store_compacted", deleted=deleted, size_bytes=self.size_bytes())
+        return deleted
+
+    def start_compactor(self, ttl=0):
+        """Compact in a daemon thread every compact_interval seconds, once per process"""
+        if not self.enabled or self._compactor is not None or not self.compact_interval:
+            return
+        with self._lock:
+            if self._compactor is None:
+                self._compactor = threading.Thread(target=self._compact_forever, args=(ttl,),
+                                                   name="wish-store-compactor", daemon=True)
+                self._compactor.start()
+
+    def _compact_forever(self, ttl):
+        while True:
+            time.sleep(self.compact_interval)
+            self.compact(ttl)
+
+    def stats(self):
+        def query(conn):
+            return {
+                "cache_rows": conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0],
+                "skeletons": conn.execute("SELECT COUNT(*) FROM skeletons").fetchone()[0],
+            }
+        stats = self._run("stats", query, {"cache_rows": 0, "skeletons": 0})
+        stats.update(size_bytes=self.size_bytes() if self.enabled else 0, errors=self.errors,
+                     compactions=self.compactions)
+        return stats
+
+
+# Every worker on the box opens the same file
+wish_store = WishStore.from_env()